@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+import argparse
+import logging
+import multiprocessing
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import pyarrow as pa
+
+from currency import COMMON_CURRENCIES, ExchangeRates
+from fetcher import AdaptiveRateLimiter
+from get_procurements import (
+    MAX_RATE, MIN_RATE, RATE, REFRESH_SPAN, SNAPSHOT_SPAN, Collector)
+from lake import ParquetLake
+from store import TenderStore
+from utils import DUCKDB_NAME, STAGING_DIR
+
+
+PROCESSES = 4
+
+# Set in every worker process by `_init_worker`
+_known: Dict[str, Optional[int]] = {}
+_rates: Optional[pa.Table] = None
+_processes = 1
+
+
+def shard_path(day: date) -> Path:
+    return Path(STAGING_DIR) / f"tenders-{day.isoformat()}.db"
+
+
+def checkpoint_path(day: date) -> Path:
+    return Path(STAGING_DIR) / f"checkpoint-{day.isoformat()}.json"
+
+
+def _init_worker(known: Dict[str, Optional[int]], rates: pa.Table,
+                 processes: int):
+    global _known, _rates, _processes
+    _known, _rates, _processes = known, rates, processes
+    logging.basicConfig(
+        filename='download.log',
+        filemode='a',
+        level=logging.INFO,
+        format='%(asctime)s %(name)-12s %(levelname)-8s %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S')
+
+
+def collect_shard(day: date, since: date, resume: bool,
+                  until: Optional[date] = None) -> int:
+    """
+    Collects the feed window of `day` into its own staging database;
+    runs in a worker process
+    """
+    # The workers share the API's rate limit between them
+    cap = MAX_RATE / _processes
+    limiter = AdaptiveRateLimiter(min(RATE, cap), min(MIN_RATE, cap), cap)
+    store = TenderStore(shard_path(day))
+    try:
+        store.create_tables()
+        rates = ExchangeRates(store.con)
+        rates.load(_rates)
+        collector = Collector(
+            day, store, rates=rates, since=since, until=until, known=_known,
+            limiter=limiter, checkpoint_path=checkpoint_path(day),
+            progress=False, publish=False)
+        return collector.run(resume=resume)
+    finally:
+        store.close()
+
+
+def backfill(first: date, last: date, database=DUCKDB_NAME,
+             processes: int = PROCESSES, parquet: bool = False,
+             resume: bool = False, history: bool = False) -> List[date]:
+    """
+    Collects the tenders dated from `first` to `last`. Every day's feed
+    window is crawled by a worker process into a staging database, which
+    is merged into `database` as soon as it is complete. Returns the
+    days that failed; their shards and checkpoints are kept for
+    `resume`. A tender modified within several windows ends up in its
+    latest version. The feed lists every tender once, at its latest
+    modification, so the window of `last` reaches up to now: it picks
+    up the tenders of the range modified since.
+    """
+    Path(STAGING_DIR).mkdir(parents=True, exist_ok=True)
+    days = [first + timedelta(days=n) for n in range((last - first).days + 1)]
+    failed = []
+    written = 0
+    store = TenderStore(database, history=history)
+    try:
+        store.create_tables()
+        lake = ParquetLake() if parquet else None
+        rates = ExchangeRates(store.con)
+        # Tenders of the last window may be dated the day after it
+        rates.prefetch(COMMON_CURRENCIES, first, last + timedelta(days=1))
+        known = store.known(first - REFRESH_SPAN)
+        logging.info(f"Backfill {first} - {last}: {len(days)} days, "
+                     f"{processes} processes, {len(known)} tenders "
+                     "are already stored")
+
+        # Workers are spawned, not forked: the parent holds DuckDB threads
+        with ProcessPoolExecutor(
+                processes, mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(known, rates.export(), processes)) as pool:
+            futures = {pool.submit(collect_shard, day, first, resume,
+                                   last if day == last else None): day
+                       for day in days}
+            for future in as_completed(futures):
+                day = futures[future]
+                try:
+                    future.result()
+                except Exception as e:
+                    logging.error(f"Backfill of {day} failed: {e}")
+                    failed.append(day)
+                    continue
+                merged = store.merge(shard_path(day))
+                if lake is not None:
+                    lake.append(merged)
+                written += merged.num_rows
+                shard_path(day).unlink()
+                logging.info(f"Backfill {day}: {merged.num_rows} tenders "
+                             "merged")
+        store.snapshot(first - SNAPSHOT_SPAN, day=last, complete=not failed)
+        if lake is not None:
+            lake.compact()
+    finally:
+        store.report()
+        store.close()
+    logging.info(f"Backfill complete: {written} tenders written, "
+                 f"{len(days) - len(failed)} of {len(days)} days done")
+    if failed:
+        logging.error(f"Failed days: {', '.join(map(str, sorted(failed)))}; "
+                      "restart with --resume")
+    return failed
+
+
+def parse_args(argv: Optional[Sequence[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Collects the Prozorro tenders of a date range into "
+                    "DuckDB, several days at once. The feed window of the "
+                    "last date is crawled up to now, to catch the tenders "
+                    "of the range modified after it; the older the range, "
+                    "the longer that crawl takes.")
+    parser.add_argument("first", type=date.fromisoformat,
+                        help="first tender date, YYYY-MM-DD")
+    parser.add_argument("last", type=date.fromisoformat,
+                        help="last tender date, YYYY-MM-DD")
+    parser.add_argument(
+        "--processes", type=int, default=PROCESSES,
+        help=f"days collected at once (default: {PROCESSES})")
+    parser.add_argument(
+        "--database", default=DUCKDB_NAME,
+        help=f"DuckDB file to write into (default: {DUCKDB_NAME})")
+    parser.add_argument(
+        "--parquet", action="store_true",
+        help="also append written tenders to the Parquet lake")
+    parser.add_argument(
+        "--resume", action="store_true",
+        help=f"continue the days left unfinished in {STAGING_DIR}/")
+    parser.add_argument(
+        "--history", action="store_true",
+        help="keep the replaced versions of modified tenders in "
+             "tender_history")
+    args = parser.parse_args(argv)
+    if args.last < args.first:
+        parser.error("last date is before the first one")
+    return args
+
+
+def main(argv: Optional[Sequence[str]] = None):
+    args = parse_args(argv)
+    logging.basicConfig(
+        filename='download.log',
+        filemode='a',
+        level=logging.INFO,
+        format='%(asctime)s %(name)-12s %(levelname)-8s %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S')
+    logging.getLogger().addHandler(logging.StreamHandler())
+    failed = backfill(args.first, args.last, database=args.database,
+                      processes=args.processes, parquet=args.parquet,
+                      resume=args.resume, history=args.history)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
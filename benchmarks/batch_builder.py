@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Time to turn parsed tender rows into an Arrow batch: one dict per row
+and `pa.Table.from_pylist`, against `TenderBatchBuilder`:
+
+    python benchmarks/batch_builder.py --rows 10000 100000 1000000
+"""
+
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import pyarrow as pa  # noqa: E402
+
+from store import TenderBatchBuilder, tender_schema  # noqa: E402
+
+
+def row(i: int) -> tuple:
+    # As get_tender_info returns them: codes, dates and timestamps as text
+    return (f"1234567{i % 10}", f"Entity name {i}", "reporting",
+            "reporting.active", "2024-03-20T10:00:00+02:00",
+            f"Some title of tender {i}", f"UA-2024-03-10-{i:06d}-a",
+            f"{i:032x}", float(i), i * 41.2, "UAH", True, "2024-03-10",
+            "2024-03-10T12:00:00.123456+02:00")
+
+
+def from_dicts(rows) -> pa.RecordBatch:
+    raw_schema = TenderBatchBuilder().raw_schema
+    table = pa.Table.from_pylist(
+        [dict(zip(tender_schema.names, r)) for r in rows], schema=raw_schema)
+    return table.cast(tender_schema).combine_chunks().to_batches()[0]
+
+
+def with_builder(rows) -> pa.RecordBatch:
+    builder = TenderBatchBuilder()
+    for r in rows:
+        builder.append(r)
+    return builder.build()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument("--rows", type=int, nargs="+",
+                        default=[10_000, 100_000, 1_000_000])
+    args = parser.parse_args()
+    sample = [row(i) for i in range(100)]
+    assert from_dicts(sample).equals(with_builder(sample))
+    for n in args.rows:
+        rows = [row(i) for i in range(n)]
+        timings = []
+        for build in (from_dicts, with_builder):
+            start = time.perf_counter()
+            batch = build(rows)
+            timings.append(time.perf_counter() - start)
+            assert batch.num_rows == n
+        old, new = timings
+        print(f"{n:>9} rows: dicts + from_pylist {old:.3f} s, "
+              f"TenderBatchBuilder {new:.3f} s, x{old / new:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Time and retained memory of decoding recorded tender documents with
+`json.loads` against `decoder.decode_tender`; the payloads come from a
+directory written by `get_procurements.py --record`:
+
+    python benchmarks/decoder.py records/2024-03-01
+"""
+
+
+import argparse
+import gzip
+import json
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from decoder import decode_tender, msgspec  # noqa: E402
+
+
+def payloads(directory: Path, limit: int):
+    lines = []
+    for path in sorted(directory.glob("tenders-*.ndjson.gz")):
+        with gzip.open(path, "rb") as f:
+            for line in f:
+                lines.append(line)
+                if len(lines) == limit:
+                    return lines
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument("directory", type=Path,
+                        help="recording of one day")
+    parser.add_argument("--limit", type=int, default=100_000,
+                        help="payloads read at most (default: 100000)")
+    args = parser.parse_args()
+    lines = payloads(args.directory, args.limit)
+    if not lines:
+        parser.error(f"no recorded tenders in {args.directory}")
+    size = sum(map(len, lines)) / 2 ** 20
+    print(f"{len(lines)} payloads, {size:.1f} MiB, "
+          f"msgspec {'installed' if msgspec else 'missing'}")
+    for name, decode in (
+            ("json.loads", json.loads),
+            ("decode_tender", lambda b: decode_tender(b, envelope=False))):
+        start = time.perf_counter()
+        for line in lines:
+            decode(line)
+        seconds = time.perf_counter() - start
+        tracemalloc.start()
+        kept = [decode(line) for line in lines]
+        retained = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del kept
+        print(f"{name:>14}: {seconds:.3f} s ({size / seconds:.0f} MiB/s), "
+              f"{retained / 2 ** 20:.1f} MiB retained")
+
+
+if __name__ == "__main__":
+    main()
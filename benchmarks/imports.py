@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Start-up cost of the entry points: `import currency`, `import bot`,
+`import get_procurements` and `get_procurements.py --help`, each in a
+fresh interpreter; reports the median wall time over `--runs`:
+
+    python benchmarks/imports.py --runs 11
+"""
+
+
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+REPO = Path(__file__).resolve().parent.parent
+
+COMMANDS = {
+    "import currency": ["-c", "import currency"],
+    "import bot": ["-c", "import bot"],
+    "import get_procurements": ["-c", "import get_procurements"],
+    "get_procurements.py --help": [
+        str(REPO / "get_procurements.py"), "--help"],
+}
+
+
+def timed(args) -> float:
+    start = time.perf_counter()
+    subprocess.run([sys.executable, *args], cwd=REPO, check=True,
+                   stdout=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument("--runs", type=int, default=11)
+    args = parser.parse_args()
+    baseline = statistics.median(
+        timed(["-c", "pass"]) for _ in range(args.runs))
+    print(f"{'python -c pass':>28}: {baseline * 1000:.0f} ms")
+    for name, command in COMMANDS.items():
+        # The first run warms the bytecode cache and the page cache
+        timed(command)
+        median = statistics.median(
+            timed(command) for _ in range(args.runs))
+        print(f"{name:>28}: {median * 1000:.0f} ms "
+              f"(+{(median - baseline) * 1000:.0f} ms over the interpreter)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Throughput of `text_clean` applied string by string against
+`text_clean_batch` over the whole column:
+
+    python benchmarks/text_clean.py --rows 200000
+"""
+
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from utils import text_clean, text_clean_batch  # noqa: E402
+
+
+def titles(n: int):
+    return [f'  Закупівля "товарів"&nbsp;для  потреб\xa0№{i} '
+            f'`ДК 021:2015`  ' * 2 for i in range(n)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument("--rows", type=int, default=200_000)
+    args = parser.parse_args()
+    strings = titles(args.rows)
+    megabytes = sum(len(s.encode()) for s in strings) / 2 ** 20
+    for options in ({}, {"typostrofe": True},
+                    {"translit": True, "uk2en": True}):
+        start = time.perf_counter()
+        [text_clean(s, **options) for s in strings]
+        scalar = time.perf_counter() - start
+        start = time.perf_counter()
+        text_clean_batch(strings, **options)
+        batch = time.perf_counter() - start
+        print(f"{options or 'defaults'}: text_clean {scalar:.3f} s "
+              f"({megabytes / scalar:.0f} MB/s), text_clean_batch "
+              f"{batch:.3f} s ({megabytes / batch:.0f} MB/s), "
+              f"x{scalar / batch:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,152 +2,240 @@
 # -*- coding: utf-8 -*-
 
 
+import argparse
 import locale
 import logging
+import os
 import pickle
 import duckdb
 import telebot
 import sys
-import time
 from pathlib import Path
-from typing import List
+from typing import Dict, List, Optional, Sequence
 
-from config import TOKEN, CHANNEL
+from feeds import Feed, rank_feeds
+from publisher import fan_out, pack
+from store import read_snapshot_meta, snapshot_path
 from utils import (
-    DUCKDB_NAME, BULLET, NOBR, BOX, LIMIT,
-    Tender, START_DATE, make_csv_datafile,
-    beautify_number)
+    DUCKDB_NAME, ARCHIVE_DIR, BULLET, NOBR, BOX, KYIV_ZONE,
+    Tender, START_DATE, beautify_number)
 
 
-logging.basicConfig(
-    filename='bot.log',
-    filemode='a',
-    level=logging.INFO,
-    format='%(asctime)s %(name)-12s %(levelname)-8s %(message)s',
-    datefmt='%Y-%m-%d %H:%M:%S')
-
-try:
-    locale.setlocale(locale.LC_TIME, "uk_UA.UTF-8")
-    locale.setlocale(locale.LC_NUMERIC, "uk_UA.UTF-8")
-    LOC_DATE = "%d %B %Y"
-except locale.Error:
-    logging.warning("Locale is not supported")
-    LOC_DATE = r"%d.%m.%Y"
-
-
-bot = telebot.TeleBot(TOKEN)
-already_sent = False
-current_dt = sent_dt = None
-current_dt_file = Path("./current_dt.txt")
-
-
-def send_messages(message_box: List[str]):
-    try:
-        for msg in message_box:
-            bot.send_message(
-                CHANNEL, msg, parse_mode='HTML',
-                disable_web_page_preview=True)
-            time.sleep(.64)
-    except Exception:
-        logging.error("Portion does not sent")
-        raise
-    else:
-        logging.info("Successfully sent")
-        current_dt_file.write_text(f"{current_dt}")
-
-# Інформація для БОТА
-logging.info(f"Perform Database Query")
-
 qry_template = (
-    "SELECT tenders.*"
+    "SELECT tenders.* EXCLUDE (date_modified)"
     "  , procdict.procedure_name, statusdict.status_name"
     "  from tenders"
     "  LEFT JOIN procdict"
     "  on tenders.proc_type = procdict.procedure"
     "  LEFT JOIN statusdict"
     "  on tenders.status = statusdict.status"
-    f"  where date= '{START_DATE}'"
-    "  order by price_uah desc;")
-
-qry_box: list[tuple] = []
-
-try:
-    with duckdb.connect(DUCKDB_NAME) as con:
-        qry_box = con.sql(qry_template).fetchall()
-
-    if not qry_box:
-        raise ValueError("Empty query result")
-except (ValueError, Exception) as e:
-    logging.error("Error to fetch procurement chart's top")
-    logging.error(e)
-else:
-    logging.info(f"Database Query Done")
-    tenders_info = [Tender.from_tuple(r) for r in qry_box[:LIMIT]]
-    with open("qry_res.pickle", "wb") as f:
-        pickle.dump(qry_box, f)
-    
-with open("tenders_.pickle", "wb") as f:
-    pickle.dump(tenders_info, f) # type: ignore
-
-try:
-    make_csv_datafile(qry_box, filedate=START_DATE)
-except Exception as e:
-    logging.error(e)
-
-try:
-    with open("tenders_.pickle", "rb") as f:
-        top_tenders = pickle.load(f)
-    if not top_tenders:
-        raise ValueError
-except (AttributeError, ValueError):
-    logging.critical("Can't load top: Empty TOP")
-    sys.exit(1)
-except FileNotFoundError:
-    logging.critical("TOP File is missing")
-    sys.exit(1)
-
-if current_dt_file.is_file():
-    sent_dt = current_dt_file.read_text()
-else:
-    current_dt_file.write_text("1970-01-01")
-
-first_msg = True
-message_box: list[str] = []
-msg_portion = []
-for m in top_tenders:
-    msg = f'{BULLET}{NOBR}<b>{beautify_number(m.price_uah)}</b>{NOBR}'\
-      f'— {m.entity_name.strip()} (<a href="https://clarity-project.info/edr/'\
-      f'{int(m.entity_id)}">{m.entity_id}</a>)\n'\
-      f'<a href="https://prozorro.gov.ua/tender/{m.uaid}">'\
-      f'{m.title[:120] + "…"}</a>\nПроцедура: <em>{m.procedure_name}</em>'
-    if first_msg:
-        current_dt = m.date
-        if current_dt == sent_dt:
-            logging.error("Already sent")
-            already_sent = True
-        msg = f'За {current_dt.strftime(LOC_DATE)} було створено '\
-              'такий топ закупівель:\n\n' + msg
-        first_msg = False
-    cur_portion = "\n\n".join(msg_portion)
-    len_cur_portion = len(cur_portion)
-
-    if len_cur_portion + len(msg) + 2 > 4096:
-        message_box.append(cur_portion)
-        msg_portion = [msg]
-    else:
-        msg_portion.append(msg)
-message_box.append("\n\n".join(msg_portion))
-
-# Add link to archive
-archive_advertise = (f'\n\n<a href="https://zbs.dp.ua/moneydog">{BOX}'
-                    'Архів останніх закупівель</a>')
-if message_box:
-    last_msg_lehgth = len(message_box[-1])
-    if last_msg_lehgth < 4026:
-        new_msg = message_box[-1] + archive_advertise
-        message_box[-1] = new_msg
+    "  where date = ?"
+    "  order by price_uah desc")
+
+# The top comes pre-ranked from daily_top, kept up to date by the collector
+top_template = (
+    "SELECT daily_top.* EXCLUDE (rank, date_modified)"
+    "  , procdict.procedure_name, statusdict.status_name"
+    "  from daily_top"
+    "  LEFT JOIN procdict"
+    "  on daily_top.proc_type = procdict.procedure"
+    "  LEFT JOIN statusdict"
+    "  on daily_top.status = statusdict.status"
+    "  where daily_top.date = ?"
+    "  order by daily_top.rank"
+    "  limit ?;")
+
+# Text columns of the archive, quoted as csv.QUOTE_NONNUMERIC used to do
+archive_quoted = (
+    "entity_id, entity_name, proc_type, status, clarif_until, title, uaid, "
+    "id, currency, procedure_name, status_name")
+
+
+def setup_logging():
+    logging.basicConfig(
+        filename='bot.log',
+        filemode='a',
+        level=logging.INFO,
+        format='%(asctime)s %(name)-12s %(levelname)-8s %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S')
+
+
+def setup_locale() -> str:
+    """
+    Switches dates and numbers to Ukrainian; returns the date format
+    """
+    try:
+        locale.setlocale(locale.LC_TIME, "uk_UA.UTF-8")
+        locale.setlocale(locale.LC_NUMERIC, "uk_UA.UTF-8")
+        return "%d %B %Y"
+    except locale.Error:
+        logging.warning("Locale is not supported")
+        return r"%d.%m.%Y"
+
+
+def parse_args(argv: Optional[Sequence[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Posts the top of the day's tenders to Telegram")
+    parser.add_argument(
+        "--database", default=DUCKDB_NAME,
+        help=f"DuckDB file to read from (default: {DUCKDB_NAME})")
+    parser.add_argument(
+        "--live", action="store_true",
+        help="read the database itself rather than the snapshot the "
+             "collector publishes next to it")
+    parser.add_argument(
+        "--date", default=START_DATE,
+        help=f"tender date to post (default: {START_DATE})")
+    return parser.parse_args(argv)
+
+
+def export_day(con: duckdb.DuckDBPyConnection, day: str) -> Path:
+    """
+    Streams all tenders of `day` into a gzipped, tab-separated CSV in the
+    archive directory; the file appears under its final name only when
+    it is complete
+    """
+    Path(ARCHIVE_DIR).mkdir(parents=True, exist_ok=True)
+    archive = Path(ARCHIVE_DIR) / f"{day.replace('-', '')}_data.csv.gz"
+    tmp = archive.with_name(f".{archive.name}.tmp")
+    escaped = tmp.as_posix().replace("'", "''")
+    # Timestamps are written in Kyiv time, as the API gives them
+    con.execute(f"SET TimeZone = '{KYIV_ZONE.key}';")
+    con.execute(
+        f"COPY ({qry_template}) TO '{escaped}' "
+        "(FORMAT CSV, DELIMITER '\t', HEADER, COMPRESSION gzip, "
+        f"FORCE_QUOTE ({archive_quoted}));", [day])
+    os.replace(tmp, archive)
+    return archive
+
+
+def snapshot_ready(database, day: str) -> bool:
+    """
+    Whether the snapshot holds the finished collection of `day`: the
+    collector has either completed that day or moved past it
+    """
+    with duckdb.connect(str(database), read_only=True) as con:
+        meta = read_snapshot_meta(con)
+    if meta is None:
+        logging.error(f"{database} does not tell which day it holds")
+        return False
+    collected, complete = meta
+    if collected.isoformat() < day or (
+            collected.isoformat() == day and not complete):
+        logging.error(f"{database} holds {collected}, "
+                      f"{'complete' if complete else 'still collecting'}")
+        return False
+    return True
+
+
+def query_feeds(database: str, day: str,
+                feeds: Sequence[Feed]) -> Dict[str, List[List[Tender]]]:
+    """
+    Tops of `day` for every feed, as lists of groups; the plain tops are
+    read from daily_top, the other rankings are computed in one pass over
+    the day. Also exports the whole day to the archive.
+    """
+    # Інформація для БОТА
+    logging.info(f"Perform Database Query")
+    tops: Dict[str, List[List[Tender]]] = {}
+    try:
+        with duckdb.connect(database, read_only=True) as con:
+            for f in feeds:
+                if f.plain:
+                    top = con.execute(top_template, [day, f.limit]).fetchall()
+                    tops[f.name] = [[Tender.from_tuple(r) for r in top]] \
+                        if top else []
+            ranked = [f for f in feeds if not f.plain]
+            if ranked:
+                tops.update(rank_feeds(con, day, ranked))
+            if not any(tops.values()):
+                raise ValueError("Empty query result")
+            try:
+                export_day(con, day)
+            except (duckdb.Error, OSError) as e:
+                logging.error(e)
+    except (ValueError, Exception) as e:
+        logging.error("Error to fetch procurement chart's top")
+        logging.error(e)
+        tops = {}
     else:
-        message_box.append(archive_advertise)
+        logging.info(f"Database Query Done")
+
+    with open("tenders_.pickle", "wb") as f:
+        pickle.dump(tops, f)
+    return tops
+
+
+def make_messages(feed: Feed, groups: List[List[Tender]],
+                  loc_date: str) -> List[str]:
+    """
+    Formats a feed's top and packs it into Telegram-sized messages
+    """
+    pieces = []
+    for group in groups:
+        for m in group:
+            msg = f'{BULLET}{NOBR}<b>{beautify_number(m.price_uah)}</b>{NOBR}'\
+              f'— {m.entity_name.strip()} (<a href="https://clarity-project.info/edr/'\
+              f'{int(m.entity_id)}">{m.entity_id}</a>)\n'\
+              f'<a href="https://prozorro.gov.ua/tender/{m.uaid}">'\
+              f'{m.title[:120] + "…"}</a>\nПроцедура: <em>{m.procedure_name}</em>'
+            fields = {**vars(m), "date": m.date.strftime(loc_date)}
+            if m is group[0] and feed.group_title:
+                msg = feed.group_title.format(**fields) + '\n\n' + msg
+            if not pieces:
+                msg = feed.title.format(**fields) + '\n\n' + msg
+            pieces.append(msg)
+
+    # Add link to archive
+    archive_advertise = (f'\n\n<a href="https://zbs.dp.ua/moneydog">{BOX}'
+                        'Архів останніх закупівель</a>')
+    return pack(pieces, suffix=archive_advertise)
+
+
+def main(argv: Optional[Sequence[str]] = None):
+    args = parse_args(argv)
+    setup_logging()
+    loc_date = setup_locale()
+
+    # The snapshot can be read while the collector is still writing
+    database = snapshot_path(args.database)
+    if args.live or not database.is_file():
+        database = args.database
+    elif not snapshot_ready(database, args.date):
+        logging.critical(f"Collection of {args.date} is not finished")
+        sys.exit(1)
+    logging.info(f"Reading {database}")
+    import config
+    feeds = getattr(config, "FEEDS", None) or [Feed("top", config.CHANNEL)]
+    query_feeds(database, args.date, feeds)
+
+    try:
+        with open("tenders_.pickle", "rb") as f:
+            tops = pickle.load(f)
+        if not any(tops.values()):
+            raise ValueError
+    except (AttributeError, ValueError):
+        logging.critical("Can't load top: Empty TOP")
+        sys.exit(1)
+    except FileNotFoundError:
+        logging.critical("TOP File is missing")
+        sys.exit(1)
+
+    publications = []
+    for f in feeds:
+        if not tops.get(f.name):
+            logging.info(f"Feed {f.name} is empty for {args.date}")
+            continue
+        messages = make_messages(f, tops[f.name], loc_date)
+        publications.append((f.channel, f"{args.date}/{f.name}", messages))
+
+    bot = telebot.TeleBot(config.TOKEN)
+    try:
+        fan_out(bot, publications)
+    except Exception:
+        logging.error("Portion does not sent")
+        raise
+
 
-if already_sent: sys.exit()
-send_messages(message_box)
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+import json
+import logging
+import os
+import threading
+from collections import deque
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Set
+
+
+CHECKPOINT_FILE = "checkpoint.json"
+
+
+class Checkpoint:
+    """
+    Progress of a collector run, persisted to a JSON side file.
+
+    The feed thread registers every page with `page`, the main thread
+    marks IDs with `done` once they are parsed or filtered out. `offset`
+    is the feed offset of the oldest page that still has unfinished IDs
+    (or of the page after the last finished one), so a resumed run
+    restarts the crawl there and skips the IDs from `processed`. Parsed
+    records not yet confirmed by the writer are kept in `pending`;
+    re-inserting them is harmless because the store skips tenders it
+    already has in the same version.
+    """
+
+    def __init__(self, day: str, path=CHECKPOINT_FILE):
+        self.day = day
+        self.path = Path(path)
+        self.offset: Optional[str] = None
+        self.processed: Set[str] = set()
+        self.pending: Dict[str, list] = {}
+        self.stats: Dict[str, int] = {}
+        self._pages: deque = deque()
+        self._owner: Dict[str, list] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, day: str, path=CHECKPOINT_FILE) -> Optional["Checkpoint"]:
+        path = Path(path)
+        if not path.is_file():
+            return None
+        with open(path, encoding="utf-8") as f:
+            state = json.load(f)
+        if state["day"] != day:
+            logging.warning(f"Checkpoint is for {state['day']}, not {day}; "
+                            "ignored")
+            return None
+        cp = cls(day, path)
+        cp.offset = state["offset"]
+        cp.processed = set(state["processed"])
+        cp.pending = state["pending"]
+        cp.stats = state["stats"]
+        return cp
+
+    def page(self, offset: str, ids: Iterable[str], next_offset: str):
+        ids = set(ids)
+        with self._lock:
+            entry = [offset, ids - self.processed, ids, next_offset]
+            self._pages.append(entry)
+            for id_ in entry[1]:
+                self._owner.setdefault(id_, []).append(entry)
+            self._advance()
+
+    def done(self, id_: str):
+        with self._lock:
+            if (entries := self._owner.pop(id_, None)) is None:
+                return
+            self.processed.add(id_)
+            for entry in entries:
+                entry[1].discard(id_)
+            self._advance()
+
+    def _advance(self):
+        # Forget finished pages from the head of the window
+        while self._pages and not self._pages[0][1]:
+            entry = self._pages.popleft()
+            self.processed -= entry[2]
+            self.offset = entry[3]
+        if self._pages:
+            self.offset = self._pages[0][0]
+
+    def save(self, pending: Dict[str, list], stats: Dict[str, int]):
+        with self._lock:
+            state = {
+                "day": self.day,
+                "offset": self.offset,
+                "processed": sorted(self.processed),
+                "pending": pending,
+                "stats": dict(stats)}
+        tmp = self.path.with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(state, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+
+    def clear(self):
+        self.path.unlink(missing_ok=True)
@@ -155,3 +155,8 @@ STATUSDICT = (
  ('simple.defense.active.qualification','Кваліфікація переможця (кваліфікація)'),
  ('simple.defense.active.tendering','Очікування пропозицій (пропозиції)'),
 )
+
+# Currencies of tender values, in order of frequency; others are added to
+# the stored ENUM when they first appear
+CURRENCIES = ('UAH', 'USD', 'EUR', 'GBP', 'PLN', 'CHF', 'CZK', 'CAD', 'JPY',
+              'SEK', 'NOK', 'DKK', 'CNY')
@@ -2,4 +2,17 @@
 # -*- coding: utf-8 -*-
 
 TOKEN = "1234567890:9aK2RbF3cG4T5dH6eJ7fL8gM9hN0iP-kR3l"
-CHANNEL = -1001234567890
\ No newline at end of file
+CHANNEL = -1001234567890
+
+# Extra rankings, each posted to its own channel (see feeds.py); without
+# FEEDS only the top of the day is posted to CHANNEL
+# from feeds import Feed
+# FEEDS = [
+#     Feed("top", CHANNEL),
+#     Feed("procedures", -1001234567891, limit=3, partition="proc_type",
+#          group_title="<b>{procedure_name}</b>"),
+#     Feed("entities", -1001234567892, limit=3, partition="entity_id",
+#          groups=10),
+#     Feed("defense", -1001234567893, where="proc_type LIKE '%.defense'"),
+#     Feed("usd", -1001234567894, where="currency = 'USD'"),
+# ]
@@ -1,69 +1,229 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-import requests
-from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
 import logging
-import json
-
-
-HEADERS = {
-    "User-Agent": "Mozilla/5.0 (X11; Linux x86_64; rv:47.0) Gecko/20100101 Firefox/47.0",
-    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8"}
-
-logging.basicConfig(
-    filename='download.log',
-    filemode='w',
-    level=logging.INFO,
-    format='%(asctime)s %(name)-12s %(levelname)-8s %(message)s',
-    datefmt='%Y-%m-%d %H:%M:%S')
-rootLogger = logging.getLogger('download')
-fileHandler = logging.FileHandler('download.log')
-rootLogger.addHandler(fileHandler)
-consoleHandler = logging.StreamHandler()
-rootLogger.addHandler(consoleHandler)
-
-
-s = requests.Session()
-s.headers.update(HEADERS)
-yesterday = datetime.today() - timedelta(hours=24)
-START_DATE = yesterday.date().isoformat()
-
-def get_exchange(currency, date):
-    exdate = (datetime.fromisoformat(date) - timedelta(hours=24)).strftime("%Y%m%d")
-    res = s.get("https://bank.gov.ua/NBUStatService/v1/statdirectory/exchange",
-                params={"valcode":currency, "date": exdate,
-                       "json": True})
+import threading
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import duckdb
+import pyarrow as pa
+from requests import RequestException
+
+from store import rates_create_string, rates_schema
+from transport import Transport
+
+
+NBU_URL = "https://bank.gov.ua/NBUStatService/v1/statdirectory/exchange"
+NBU_RANGE_URL = "https://bank.gov.ua/NBU_Exchange/exchange_site"
+REQUEST_TIMEOUT = 30  # seconds
+# A tender is priced with the official rate of the day before its date
+RATE_LAG = timedelta(days=1)
+# Range requests start this much earlier, so that a day without a
+# published rate still gets the last rate before it
+LOOKBACK = timedelta(days=7)
+# Longest range filled with per-day requests if the range request fails
+PER_DAY_MAX = 31
+# Prefetched for multi-day runs; other currencies are fetched on demand
+COMMON_CURRENCIES = ("USD", "EUR", "GBP")
+
+
+def get_exchange(http: Transport, currency: str,
+                 day: date) -> Optional[float]:
+    res = http.get(NBU_URL,
+                   params={"valcode": currency, "date": f"{day:%Y%m%d}",
+                           "json": True},
+                   timeout=REQUEST_TIMEOUT)
     if res.status_code != 200:
-        print(":(")
         return
     k = res.json()
-    return k[0]['rate']
-
-
-def read_exchange():
-    k = {"UAH": 1, "date": START_DATE}
-    try:
-        u = get_exchange("USD", START_DATE)
-        e = get_exchange("EUR", START_DATE)
-        g = get_exchange("GBP", START_DATE)
-        if any([x is None for x in (u, e, g)]):
-            raise ValueError
-    except:
-        with open("exchange.json") as f:
-            k = json.load(f)
-        logging.warning('CURRENCY: Cannot fetch actual exchange rate, restored.')
-        # raise
-    else:
-        k["EUR"] = e
-        k["USD"] = u
-        k['GBP'] = g
-        with open("exchange.json", "w") as f:
-            json.dump(k, f)
-        logging.info('Exchange rates saved.')
-    finally:
-        logging.info('Exchange rate updated.')
-    return k
-
-
-EXCHANGE = read_exchange()
+    return k[0]['rate'] if k else None
+
+
+def get_exchange_range(http: Transport, currency: str, start: date,
+                       end: date) -> Dict[date, float]:
+    """
+    Official rates of `currency` for the days from `start` to `end` in a
+    single request
+    """
+    res = http.get(NBU_RANGE_URL,
+                   params={"start": f"{start:%Y%m%d}", "end": f"{end:%Y%m%d}",
+                           "valcode": currency.lower(),
+                           "sort": "exchangedate", "order": "asc",
+                           "json": True},
+                   timeout=REQUEST_TIMEOUT)
+    res.raise_for_status()
+    rates = {}
+    for r in res.json():
+        day = datetime.strptime(r["exchangedate"], "%d.%m.%Y").date()
+        rate = r.get("rate_per_unit")
+        rates[day] = rate if rate is not None \
+            else r["rate"] / (r.get("units") or 1)
+    return rates
+
+
+def fill_days(rates: Dict[date, float]) -> List[Tuple[date, float]]:
+    """
+    One rate per calendar day between the first and the last published
+    one; a day without a rate keeps the previous day's rate
+    """
+    if not rates:
+        return []
+    days = sorted(rates)
+    filled, rate = [], None
+    day = days[0]
+    while day <= days[-1]:
+        rate = rates.get(day, rate)
+        filled.append((day, rate))
+        day += timedelta(days=1)
+    return filled
+
+
+class ExchangeRates:
+    """
+    NBU rates to UAH by `(currency, date)`, kept in the `exchange_rates`
+    table of `con` and in an in-process cache. A currency's rates are
+    downloaded the first time a day is asked for that is not stored
+    yet; `prefetch` fills whole ranges for several currencies at once.
+    """
+
+    def __init__(self, con: Optional[duckdb.DuckDBPyConnection] = None,
+                 http: Optional[Transport] = None):
+        # Own cursor, usable next to a writer thread on the same database
+        self.con = (con if con is not None else duckdb.connect()).cursor()
+        self.con.sql(rates_create_string)
+        self._http = http
+        self._cache: Dict[Tuple[str, date], Optional[float]] = {}
+        self._tried: Set[Tuple[str, date, date]] = set()
+        self._lock = threading.Lock()
+
+    @property
+    def http(self) -> Transport:
+        if self._http is None:
+            self._http = Transport(pool_size=4)
+        return self._http
+
+    def _lookup(self, currency: str, day: date,
+                exact: bool = True) -> Optional[float]:
+        row = self.con.execute(
+            "SELECT rate FROM exchange_rates "
+            "WHERE currency = ? AND date <= ? AND date >= ? "
+            "ORDER BY date DESC LIMIT 1;",
+            [currency, day, day if exact else day - LOOKBACK]).fetchone()
+        return row[0] if row else None
+
+    def _missing(self, currencies: Iterable[str], first: date,
+                 last: date) -> List[str]:
+        days = (last - first).days + 1
+        stored = dict(self.con.execute(
+            "SELECT currency, count(*) FROM exchange_rates "
+            "WHERE date BETWEEN ? AND ? GROUP BY currency;",
+            [first, last]).fetchall())
+        return [c for c in currencies if stored.get(c, 0) < days
+                and (c, first, last) not in self._tried]
+
+    def _download(self, currency: str, start: date,
+                  end: date) -> Dict[date, float]:
+        try:
+            return get_exchange_range(self.http, currency, start, end)
+        except (RequestException, ValueError, KeyError) as e:
+            logging.warning(f"CURRENCY: range request for {currency} "
+                            f"failed ({e})")
+        if (end - start).days >= PER_DAY_MAX:
+            return {}
+        rates = {}
+        day = start
+        while day <= end:
+            try:
+                if (rate := get_exchange(self.http, currency, day)) \
+                        is not None:
+                    rates[day] = rate
+            except (RequestException, ValueError, KeyError):
+                pass
+            day += timedelta(days=1)
+        return rates
+
+    def _prefetch(self, currencies: Iterable[str], first: date, last: date):
+        # `first` and `last` are rate days here
+        todo = self._missing(
+            {c for c in currencies if c != "UAH"}, first, last)
+        if not todo:
+            return
+        self._tried.update((c, first, last) for c in todo)
+        start = first - LOOKBACK
+        with ThreadPoolExecutor(max_workers=len(todo)) as pool:
+            fetched = list(pool.map(
+                lambda c: self._download(c, start, last), todo))
+        rows = [(c, day, rate) for c, rates in zip(todo, fetched)
+                for day, rate in fill_days(rates)]
+        if not rows:
+            return
+        self._store(pa.Table.from_pylist(
+            [dict(zip(rates_schema.names, r)) for r in rows],
+            schema=rates_schema))
+        logging.info(f"Exchange rates stored: {len(rows)} for "
+                     f"{', '.join(sorted(todo))}")
+
+    def _store(self, table: pa.Table):
+        self.con.register("rates_data", table)
+        try:
+            self.con.execute("INSERT OR REPLACE INTO exchange_rates "
+                             "SELECT * FROM rates_data;")
+        finally:
+            self.con.unregister("rates_data")
+
+    def prefetch(self, currencies: Iterable[str], first: date, last: date):
+        """
+        Stores the rates for tenders dated from `first` to `last`,
+        downloading each currency's missing days with one request
+        """
+        with self._lock:
+            self._prefetch(currencies, first - RATE_LAG, last - RATE_LAG)
+
+    def export(self) -> pa.Table:
+        """
+        All stored rates, e.g. to seed another database with `load`
+        """
+        with self._lock:
+            return self.con.execute(
+                "SELECT * FROM exchange_rates;").to_arrow_table()
+
+    def load(self, table: pa.Table):
+        with self._lock:
+            self._store(table)
+
+    def rate(self, currency: str, day: date) -> Optional[float]:
+        """
+        UAH per unit of `currency` for a tender dated `day`, or None if
+        no rate can be found
+        """
+        if currency == "UAH":
+            return 1
+        key = (currency, day)
+        if key in self._cache:
+            return self._cache[key]
+        with self._lock:
+            rate_day = day - RATE_LAG
+            rate = self._lookup(currency, rate_day)
+            if rate is None:
+                self._prefetch([currency], rate_day, rate_day)
+                rate = self._lookup(currency, rate_day, exact=False)
+            if rate is None:
+                logging.error(f"CURRENCY: no {currency} rate for {day}")
+            self._cache[key] = rate
+        return rate
+
+
+_default: Optional[ExchangeRates] = None
+
+
+def default_rates() -> ExchangeRates:
+    """
+    Process-wide rates kept in an in-memory database, created on the
+    first call
+    """
+    global _default
+    if _default is None:
+        _default = ExchangeRates()
+    return _default
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+import json
+from typing import Any, List, Optional, TypedDict, Union
+
+try:
+    import msgspec
+except ImportError:  # optional, stdlib json is used instead
+    msgspec = None
+
+
+# Only the fields read by get_tender_info/TenderDateResolver/the feed
+# filters; msgspec skips everything else without building objects.
+# Fields are declared loosely (Optional, total=False) so any document the
+# parser copes with also decodes here.
+
+class _Identifier(TypedDict, total=False):
+    id: Optional[str]
+
+
+class _ProcuringEntity(TypedDict, total=False):
+    name: Optional[str]
+    identifier: _Identifier
+
+
+class _EnquiryPeriod(TypedDict, total=False):
+    startDate: Optional[str]
+    clarificationsUntil: Optional[str]
+
+
+class _Value(TypedDict, total=False):
+    amount: Optional[float]
+    currency: Optional[str]
+    valueAddedTaxIncluded: Optional[bool]
+
+
+class _Document(TypedDict, total=False):
+    datePublished: Optional[str]
+    dateModified: Optional[str]
+
+
+class TenderData(TypedDict, total=False):
+    id: str
+    tenderID: Optional[str]
+    procurementMethodType: Optional[str]
+    status: Optional[str]
+    title: Optional[str]
+    date: Optional[str]
+    dateCreated: Optional[str]
+    dateModified: Optional[str]
+    data: Any
+    procuringEntity: _ProcuringEntity
+    enquiryPeriod: _EnquiryPeriod
+    value: _Value
+    documents: List[_Document]
+
+
+class _Envelope(TypedDict, total=False):
+    data: TenderData
+
+
+if msgspec is not None:
+    _envelope_decoder = msgspec.json.Decoder(_Envelope)
+    _data_decoder = msgspec.json.Decoder(TenderData)
+
+
+def decode_tender(buf: Union[bytes, str],
+                  envelope: bool = True) -> Optional[dict]:
+    """
+    Decodes a tender document keeping only the fields the collector
+    reads. `buf` is an API response (`{"data": {...}}`) or, with
+    `envelope=False`, the bare tender. Falls back to the full stdlib
+    decode when msgspec is not installed or rejects the document.
+    """
+    if msgspec is not None:
+        try:
+            if envelope:
+                return _envelope_decoder.decode(buf).get("data")
+            return _data_decoder.decode(buf)
+        except msgspec.ValidationError:
+            pass
+    doc = json.loads(buf)
+    return doc.get("data") if envelope else doc
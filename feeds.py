@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+from typing import Dict, List, NamedTuple, Optional, Sequence, Union
+
+import duckdb
+
+from store import TOP_SIZE
+from utils import LIMIT, Tender
+
+
+TOP_TITLE = "За {date} було створено такий топ закупівель:"
+TENDER_COLUMNS = list(Tender.__dataclass_fields__)
+
+
+class Feed(NamedTuple):
+    """
+    One ranking of the day's tenders by `price_uah` and the channel it
+    is posted to. `where` is an SQL condition on the tender columns
+    (including `procedure_name` and `status_name`); with `partition`,
+    every value of that column gets its own top of `limit` tenders,
+    ordered by their biggest tender and capped at `groups`. `title`
+    heads the post, `group_title` every group; both are formatted with
+    `date` and the tender fields of the group's first row.
+    """
+    name: str
+    channel: Union[int, str]
+    limit: int = LIMIT
+    where: Optional[str] = None
+    partition: Optional[str] = None
+    groups: Optional[int] = None
+    title: str = TOP_TITLE
+    group_title: Optional[str] = None
+
+    @property
+    def plain(self) -> bool:
+        """
+        The whole day's top, which is kept ranked in `daily_top`
+        """
+        return (self.where is None and self.partition is None
+                and self.limit <= TOP_SIZE)
+
+
+def check_feeds(feeds: Sequence[Feed]):
+    names = [f.name for f in feeds]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Feed names are not unique: {names}")
+    for f in feeds:
+        if f.partition is not None and f.partition not in TENDER_COLUMNS:
+            raise ValueError(f"Feed {f.name}: unknown partition column "
+                             f"{f.partition!r}")
+        if f.limit < 1 or (f.groups is not None and f.groups < 1):
+            raise ValueError(f"Feed {f.name}: limits must be positive")
+
+
+def rankings_query(feeds: Sequence[Feed]) -> str:
+    """
+    One query ranking the tenders of a day (the only parameter) for all
+    `feeds` at once. The day is read and joined once; every feed picks
+    its top per group with a `max_by` aggregate, which keeps `limit`
+    rows per group instead of sorting the whole day. The result is the
+    tender columns followed by the feed's index and the group's
+    position, ordered for posting.
+    """
+    picks = []
+    for n, f in enumerate(feeds):
+        part = f"CAST({f.partition} AS VARCHAR)" if f.partition else "NULL"
+        picks.append(
+            f"SELECT {n} AS feed, {part} AS part, "
+            f"{'NULL' if f.groups is None else int(f.groups)} AS groups, "
+            "max(price_uah) AS best, "
+            f"max_by(id, price_uah, {int(f.limit)}) AS ids FROM day"
+            + (f" WHERE {f.where}" if f.where else "")
+            + (f" GROUP BY {f.partition}" if f.partition else ""))
+    columns = ", ".join(f"day.{c}" for c in TENDER_COLUMNS)
+    return (
+        "WITH day AS MATERIALIZED ("
+        "  SELECT tenders.*"
+        "    , procdict.procedure_name, statusdict.status_name"
+        "    from tenders"
+        "    LEFT JOIN procdict"
+        "    on tenders.proc_type = procdict.procedure"
+        "    LEFT JOIN statusdict"
+        "    on tenders.status = statusdict.status"
+        "    where date = ?),"
+        f" picks AS ({' UNION ALL '.join(picks)}),"
+        " ranked AS (SELECT *, row_number() OVER ("
+        "    PARTITION BY feed ORDER BY best DESC NULLS LAST, part) AS grp"
+        "  FROM picks)"
+        f" SELECT {columns}, ranked.feed, ranked.grp"
+        " FROM ranked, unnest(ranked.ids) AS pick(id)"
+        " JOIN day ON day.id = pick.id"
+        " WHERE ranked.groups IS NULL OR ranked.grp <= ranked.groups"
+        " ORDER BY ranked.feed, ranked.grp,"
+        "  day.price_uah DESC NULLS LAST, day.id;")
+
+
+def rank_feeds(con: duckdb.DuckDBPyConnection, day: str,
+               feeds: Sequence[Feed]) -> Dict[str, List[List[Tender]]]:
+    """
+    Tops of `day` for every feed by name, as a list of groups (a single
+    one without `partition`), each ordered by price
+    """
+    check_feeds(feeds)
+    rows = con.execute(rankings_query(feeds), [day]).fetchall()
+    width = len(TENDER_COLUMNS)
+    tops: Dict[str, List[List[Tender]]] = {f.name: [] for f in feeds}
+    last = None
+    for r in rows:
+        feed, group = r[width:]
+        if (feed, group) != last:
+            tops[feeds[feed].name].append([])
+            last = feed, group
+        tops[feeds[feed].name][-1].append(Tender.from_tuple(r[:width]))
+    return tops
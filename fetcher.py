@@ -0,0 +1,309 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+import logging
+import queue
+import random
+import threading
+import time
+from concurrent.futures import (
+    ThreadPoolExecutor,
+    FIRST_COMPLETED,
+    wait)
+from typing import (
+    Callable,
+    Generic,
+    Iterable,
+    Iterator,
+    Optional,
+    Tuple,
+    TypeVar)
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+
+from requests.exceptions import ConnectionError, HTTPError, Timeout
+
+
+T = TypeVar("T")
+
+_DONE = object()
+
+# Responses worth another try after a pause
+RETRY_STATUSES = frozenset((429, 500, 502, 503, 504))
+BACKOFF_BASE = 1.0  # seconds
+BACKOFF_MAX = 60.0
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket. Every request to the API takes one token,
+    so the aggregate request rate of all workers never exceeds `rate`
+    requests per second (with bursts up to `capacity`).
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(
+            self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, tokens: float = 1.0):
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait_for = (tokens - self._tokens) / self.rate
+            time.sleep(wait_for)
+
+
+class RetriesExhausted(Exception):
+    """
+    The per-run retry budget is spent; the run should stop (and be
+    resumed later) instead of skipping the request
+    """
+
+
+class AdaptiveRateLimiter(TokenBucket):
+    """
+    Token bucket whose rate follows the server: every healthy response
+    adds `increase` requests per second (up to `max_rate`), every 429 or
+    5xx multiplies the rate by `decrease` (down to `min_rate`), at most
+    once per `cooldown` seconds so that a burst of failures from
+    concurrent workers counts once. A `Retry-After` pause blocks all
+    callers of `acquire` until it ends.
+    """
+
+    def __init__(self, rate: float, min_rate: float, max_rate: float,
+                 increase: float = 0.05, decrease: float = 0.5,
+                 cooldown: float = 1.0):
+        super().__init__(rate)
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.cooldown = cooldown
+        self._paused_until = 0.0
+        self._decreased_at = float("-inf")
+
+    def _set_rate(self, rate: float):
+        self._refill()
+        self.rate = min(self.max_rate, max(self.min_rate, rate))
+        self.capacity = max(1.0, self.rate)
+        self._tokens = min(self._tokens, self.capacity)
+
+    def success(self):
+        with self._lock:
+            self._set_rate(self.rate + self.increase)
+
+    def throttled(self, retry_after: Optional[float] = None):
+        with self._lock:
+            old_rate = self.rate
+            now = time.monotonic()
+            if now - self._decreased_at >= self.cooldown:
+                self._set_rate(self.rate * self.decrease)
+                self._decreased_at = now
+            if retry_after:
+                self._paused_until = max(
+                    self._paused_until, now + retry_after)
+        logging.warning(f"Throttled: rate {old_rate:.2f} -> {self.rate:.2f} "
+                        f"req/s, pause {retry_after or 0:.0f} s")
+
+    def acquire(self, tokens: float = 1.0):
+        while (pause := self._paused_until - time.monotonic()) > 0:
+            time.sleep(pause)
+        super().acquire(tokens)
+
+
+class RetryBudget:
+    """
+    Number of retries the whole run may spend, shared by all workers
+    """
+
+    def __init__(self, retries: int):
+        self.remaining = retries
+        self.used = 0
+        self._lock = threading.Lock()
+
+    def take(self) -> bool:
+        with self._lock:
+            if self.remaining <= 0:
+                return False
+            self.remaining -= 1
+            self.used += 1
+            return True
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    Seconds to wait from a `Retry-After` header (seconds or HTTP date)
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+def get_with_retries(session, url: str, limiter: TokenBucket,
+                     budget: RetryBudget, **kwargs):
+    """
+    GET through `limiter`, retrying connection errors, timeouts, 429 and
+    5xx responses with jittered exponential backoff (or `Retry-After`)
+    while `budget` lasts. Other responses are returned as they are.
+    """
+    attempt = 0
+    while True:
+        limiter.acquire()
+        retry_after = None
+        try:
+            res = session.get(url, **kwargs)
+        except (ConnectionError, Timeout) as e:
+            error: Exception = e
+        else:
+            if res.status_code not in RETRY_STATUSES:
+                if isinstance(limiter, AdaptiveRateLimiter):
+                    limiter.success()
+                return res
+            retry_after = parse_retry_after(res.headers.get("Retry-After"))
+            error = HTTPError(f"{res.status_code} for url: {url}",
+                              response=res)
+        if isinstance(limiter, AdaptiveRateLimiter):
+            limiter.throttled(retry_after)
+        if not budget.take():
+            raise RetriesExhausted(f"Retry budget is spent, last error: "
+                                   f"{error}") from error
+        attempt += 1
+        if retry_after is None:
+            retry_after = random.uniform(
+                0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+        logging.info(f"Retry {attempt} of {url} in {retry_after:.1f} s "
+                     f"({error})")
+        time.sleep(retry_after)
+
+
+def fetch_concurrently(fetch: Callable[[str], T], ids: Iterable[str],
+                       workers: int = 8) -> Iterator[Tuple[str, T]]:
+    """
+    Calls `fetch` for every id from `ids` in a bounded thread pool and
+    yields `(id, result)` pairs in completion order. At most
+    `2 * workers` calls are in flight, so `ids` may be a lazy iterator.
+    """
+    ids_iter = iter(ids)
+    max_pending = 2 * workers
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = {}
+        exhausted = False
+        while True:
+            while not exhausted and len(pending) < max_pending:
+                try:
+                    id_ = next(ids_iter)
+                except StopIteration:
+                    exhausted = True
+                    break
+                pending[pool.submit(fetch, id_)] = id_
+            if not pending:
+                break
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield pending.pop(future), future.result()
+
+
+def background(iterable: Iterable[T], maxsize: int = 1000) -> Iterator[T]:
+    """
+    Drains `iterable` in a daemon thread into a bounded queue and yields
+    its items, so the producer runs ahead of the consumer by at most
+    `maxsize` items. An exception raised by the producer is re-raised
+    in the consumer.
+    """
+    q: queue.Queue = queue.Queue(maxsize)
+    error = []
+
+    def produce():
+        try:
+            for item in iterable:
+                q.put(item)
+        except BaseException as e:
+            error.append(e)
+        finally:
+            q.put(_DONE)
+
+    threading.Thread(target=produce, daemon=True).start()
+    while (item := q.get()) is not _DONE:
+        yield item
+    if error:
+        raise error[0]
+
+
+class BatchWriter(Generic[T]):
+    """
+    Hands batches to `write` in a dedicated thread. At most `maxsize`
+    batches wait in the queue; `put` blocks when the writer falls behind.
+    The first error raised by `write` stops the writer and is re-raised
+    by the next `put` or by `close`; `abort` stops it without writing
+    the queued batches. `batches` counts the batches written so far, in
+    the order they were put.
+    """
+
+    def __init__(self, write: Callable[[T], int], maxsize: int = 4):
+        self.write = write
+        self.written = 0
+        self.batches = 0
+        self._queue: queue.Queue = queue.Queue(maxsize)
+        self._error: Optional[BaseException] = None
+        self._aborted = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while (batch := self._queue.get()) is not _DONE:
+            if self._error is not None or self._aborted:
+                continue
+            try:
+                self.written += self.write(batch)
+                self.batches += 1
+            except BaseException as e:
+                self._error = e
+
+    def put(self, batch: T):
+        if self._error is not None:
+            raise self._error
+        self._queue.put(batch)
+
+    def close(self) -> int:
+        self._queue.put(_DONE)
+        self._thread.join()
+        if self._error is not None:
+            raise self._error
+        return self.written
+
+    def abort(self):
+        """
+        Stops the writer once the batch being written, if any, is done:
+        queued batches are dropped and its error is not raised
+        """
+        self._aborted = True
+        try:
+            while True:
+                self._queue.get_nowait()
+        except queue.Empty:
+            pass
+        self._queue.put(_DONE)
+        self._thread.join()
@@ -7,24 +7,44 @@
 # Rewrite as a thread
 
 
+import argparse
 import logging
+import os
 import pickle
-import duckdb
+import sys
+from itertools import islice
 import pyarrow as pa
-import pyarrow.parquet as pq
 from pyarrow import ArrowInvalid
 import time
+from collections import Counter
 from datetime import (
+    date,
     datetime,
     timedelta,
     timezone)
-from typing import Optional, Dict
+from typing import (
+    Callable, Dict, Iterable, Optional, Iterator, List, Sequence, Set,
+    Tuple)
 
+import duckdb
 import requests
 import urllib3
 
-from currency import EXCHANGE
-from classifiers import PROCDICT, STATUSDICT
+from currency import ExchangeRates, default_rates
+from checkpoint import CHECKPOINT_FILE, Checkpoint
+from decoder import decode_tender
+from lake import ParquetLake
+from memory import MIB, MemoryMonitor, release
+from recorder import Recorder, Replay
+from store import TenderStore, TenderBatchBuilder
+from transport import Transport
+from fetcher import (
+    AdaptiveRateLimiter,
+    BatchWriter,
+    RetryBudget,
+    get_with_retries,
+    background,
+    fetch_concurrently)
 from tqdm import tqdm
 from requests.exceptions import (
     HTTPError,
@@ -33,324 +53,681 @@ from urllib3.exceptions import InsecureRequestWarning
 from utils import (
     YESTERDAY,
     DUCKDB_NAME,
-    START_DATE,
+    RECORD_DIR,
     KYIV_ZONE,
     text_clean,
+    text_clean_batch,
     seconds_to_hms,
     mk_offset_param)
-    
-urllib3.disable_warnings(InsecureRequestWarning)
 
 
-SLEEP = 0.24
+# Aggregate request budget shared by the feed and all detail workers,
+# adapted to the server's responses between MIN_RATE and MAX_RATE
+RATE = 4.0  # requests per second
+MIN_RATE = 0.5
+MAX_RATE = 20.0
+RETRY_BUDGET = 500  # retries per run, for the feed and details together
+REQUEST_TIMEOUT = 30  # seconds
+WORKERS = 8
+BATCH_SIZE = 500
+CHECKPOINT_EVERY = 1000  # processed feed items between checkpoints
+QUEUE_SIZE = 5000  # feed items buffered ahead of the detail workers
 API_URL = "https://api.openprocurement.org"
 API_PATH = "/api/0/tenders"
-HEADERS = {
-    "User-Agent": "Mozilla/5.0 (X11; Linux x86_64; rv:47.0) Gecko/20100101 Firefox/47.0",
-    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8"}
-
-logging.basicConfig(
-    filename='download.log',
-    filemode='w',
-    level=logging.INFO,
-    format='%(asctime)s %(name)-12s %(levelname)-8s %(message)s',
-    datefmt='%Y-%m-%d %H:%M:%S')
-rootLogger = logging.getLogger()
-fileHandler = logging.FileHandler('download.log')
-rootLogger.addHandler(fileHandler)
-consoleHandler = logging.StreamHandler()
-rootLogger.addHandler(consoleHandler)
-
-s = requests.Session()
-s.headers.update(HEADERS)
-
-tender_schema = pa.schema([
-    ("entity_id", pa.string()),
-    ("entity_name", pa.string()),
-    ("proc_type", pa.string()),
-    ("status", pa.string()),
-    ('clarif_until', pa.string()),
-    ("title", pa.string()),
-    ("uaid", pa.string()),
-    ("id", pa.string()),
-    ("price", pa.float64()),
-    ("price_uah", pa.float64()),
-    ("currency", pa.string()),
-    ("vat", pa.bool_()),
-    ("date", pa.string())
-    ])
-
-proc_schema = pa.schema([
-    ("procedure", pa.string()),
-    ("procedure_name", pa.string()),
-    ])
-
-status_schema = pa.schema([
-    ("status", pa.string()),
-    ("status_name", pa.string()),
-    ])
+# Extra feed fields used to drop old tenders before the detail request
+FEED_OPT_FIELDS = "tenderID,dateCreated"
+# Drafts may be published a while after the tenderID is issued, so the
+# pre-filter keeps tenders created shortly before the collected day
+CREATED_GRACE = timedelta(days=1)
+# Stored tenders dated this long before the collected day are fetched
+# again when the feed shows them modified since they were stored
+REFRESH_SPAN = timedelta(days=7)
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+# Feed items looked up in the store at once when the stored tenders are
+# not kept in memory (with a memory ceiling)
+LOOKUP_CHUNK = 500
+RELIEF_EVERY = 100  # processed items between two checks of the ceiling
+# Share of the memory ceiling DuckDB may use before spilling to disk
+DUCKDB_MEMORY_SHARE = 0.5
+FRESH_SPILL = "fresh.spill"
+# Days of tenders before the collected one copied into the read-only
+# snapshot published at every checkpoint
+SNAPSHOT_SPAN = timedelta(days=7)
+
+
+def setup_logging():
+    logging.basicConfig(
+        filename='download.log',
+        filemode='w',
+        level=logging.INFO,
+        format='%(asctime)s %(name)-12s %(levelname)-8s %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S')
+    rootLogger = logging.getLogger()
+    fileHandler = logging.FileHandler('download.log')
+    rootLogger.addHandler(fileHandler)
+    consoleHandler = logging.StreamHandler()
+    rootLogger.addHandler(consoleHandler)
+
+
+def parse_args(argv: Optional[Sequence[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Collects yesterday's tenders from Prozorro into DuckDB")
+    parser.add_argument(
+        "--resume", action="store_true",
+        help="continue an interrupted run from the last checkpoint")
+    parser.add_argument(
+        "--parquet", action="store_true",
+        help="also append written tenders to the Parquet lake")
+    parser.add_argument(
+        "--database", default=DUCKDB_NAME,
+        help=f"DuckDB file to write into (default: {DUCKDB_NAME})")
+    parser.add_argument(
+        "--record", action="store_true",
+        help=f"record raw API responses under {RECORD_DIR}/")
+    parser.add_argument(
+        "--replay", metavar="DIR",
+        help="parse and insert tenders recorded in DIR instead of "
+             "downloading them")
+    parser.add_argument(
+        "--max-memory", type=int, metavar="MIB",
+        help="keep the resident memory around MIB megabytes: stored "
+             "tenders are looked up in the database instead of being "
+             "loaded, DuckDB spills to disk and the collected IDs are "
+             "moved to disk when the ceiling is reached")
+    parser.add_argument(
+        "--history", action="store_true",
+        help="keep the replaced versions of modified tenders in "
+             "tender_history")
+    parser.add_argument(
+        "--rebuild-summaries", action="store_true",
+        help="recompute daily_summary and daily_top from all tenders, "
+             "report the rows that differed and exit")
+    return parser.parse_args(argv)
 
 # ======================================================================
 #   Functions
 # ======================================================================
 
-def classifier_to_table(data, schema: pa.schema):
-    columns = list(zip(*data))
-    arrays = [pa.array(col, type=f.type) for col, f in zip(columns, schema)]
-    table = pa.Table.from_arrays(arrays, schema=schema)
-    return table
-
-
-def get_procurement(tid_: str) -> Optional[dict]:
-    try:
-        res_ = s.get(f"{API_URL}{API_PATH}/{tid_}")
-        res_.raise_for_status()
-        res_json = res_.json()
-        return res_json.get('data')
-    except (requests.RequestException, ValueError, KeyError) as e:
-        logging.error(f"Error fetching procurement {tid_}: {e}")
-        return
-
-
-def get_tender_date(data: dict) -> datetime:
-    # Let tdate_ be a date in future
-    tdate_ = datetime(year=2199, month=1, day=1).astimezone()
-    if (m := data.get('enquiryPeriod')) is not None:
-        tdate_ = datetime.fromisoformat(m['startDate'])
-    elif (m := data.get('data')) is not None:
-        tdate_ = datetime.fromisoformat(m['date'])
-    elif (m := data.get('tenderID')) is not None:
-        tender_date_from_id = m[3:13]
-        tdate_ = datetime.fromisoformat(tender_date_from_id).astimezone(KYIV_ZONE)
-    elif (docs := data.get("documents")) is not None:
-        for doc in docs:
+class TenderDateResolver:
+    """
+    Date of a tender, followed by the `>= since` check. The date is the
+    start of `enquiryPeriod`, else `data.date`, else the day encoded in
+    `tenderID`, else the earliest date of its documents. At most one
+    timestamp is parsed per tender: document dates are compared as they
+    are and only the earliest one is converted to Kyiv time, and the
+    conversion of dates taken from `tenderID` is cached per day.
+    """
+
+    FAR_FUTURE = datetime(year=2199, month=1, day=1).astimezone()
+
+    def __init__(self, since: datetime):
+        self.since = since
+        self._id_dates: Dict[str, datetime] = {}
+
+    def _check(self, tdate: datetime, cutoff: bool) -> Optional[str]:
+        if cutoff and tdate < self.since:
+            return None
+        return tdate.date().isoformat()
+
+    def resolve(self, data: dict, cutoff: bool = True) -> Optional[str]:
+        """
+        ISO date of the tender, or None if it is earlier than `since`;
+        without `cutoff`, the date of any tender
+        """
+        if (m := data.get('enquiryPeriod')) is not None:
+            return self._check(datetime.fromisoformat(m['startDate']), cutoff)
+        elif (m := data.get('data')) is not None:
+            return self._check(datetime.fromisoformat(m['date']), cutoff)
+        elif (m := data.get('tenderID')) is not None:
+            key = m[3:13]
+            if key not in self._id_dates:
+                self._id_dates[key] = \
+                    datetime.fromisoformat(key).astimezone(KYIV_ZONE)
+            return self._check(self._id_dates[key], cutoff)
+        tdate = self.FAR_FUTURE
+        for doc in data.get("documents") or ():
             dt_published, dt_modified = doc["datePublished"], doc["dateModified"]
-            docs_none_list = [x is None for x in (dt_published, dt_modified)]
-            if all(docs_none_list):
+            if dt_published is None and dt_modified is None:
                 continue
-            dates_compare = (
-                tdate_,
-                *(datetime.fromisoformat(d).astimezone(KYIV_ZONE) for d in (
-                        dt_published,
-                        dt_modified)),)
-            tdate_ = min(dates_compare)
-    return tdate_
-
-
-def get_tender_info(tndr_data, currency_dict=EXCHANGE) -> Dict:
+            for d in (datetime.fromisoformat(dt_published),
+                      datetime.fromisoformat(dt_modified)):
+                if d < tdate:
+                    tdate = d
+        if tdate is not self.FAR_FUTURE:
+            tdate = tdate.astimezone(KYIV_ZONE)
+        return self._check(tdate, cutoff)
+
+
+def get_created_date(item: dict) -> Optional[date]:
+    """
+    Creation date of a feed item from `dateCreated` or, failing that,
+    from the date encoded in `tenderID` (UA-YYYY-MM-DD-...)
+    """
+    try:
+        if (m := item.get('dateCreated')) is not None:
+            return datetime.fromisoformat(m).astimezone(KYIV_ZONE).date()
+        if (m := item.get('tenderID')) is not None:
+            return date.fromisoformat(m[3:13])
+    except ValueError:
+        pass
+    return None
+
+
+def get_modified(item: dict) -> int:
+    """
+    `dateModified` of a feed item in microseconds since the epoch, as
+    `TenderStore.known` gives it
+    """
+    return ((datetime.fromisoformat(item['dateModified']) - EPOCH)
+            // timedelta(microseconds=1))
+
+
+def get_tender_info(tndr_data, tdate: Optional[str] = None,
+                    rates: Optional[ExchangeRates] = None,
+                    clean=True) -> Tuple:
+    """
+    Returns the tender's fields in `tender_schema` order. With
+    `clean=False` the entity name and the title are left raw, to be
+    cleaned batch-wise by `text_clean_batch`. Prices in foreign currency
+    are converted at the NBU rate for `tdate` (yesterday if not given)
+    taken from `rates`, by default an in-memory store.
+    """
     try:
-        result = {}
         mt = tndr_data['procurementMethodType']
-        result["proc_type"] = mt
         # Entity construction
         entity = tndr_data['procuringEntity']
-        result["entity_name"] = text_clean(entity["name"])
-        result["entity_id"] = entity["identifier"]["id"]
-        result['id'], result['uaid'] = tndr_data['id'], tndr_data['tenderID']
-        result['status'] = result["proc_type"] + "." + tndr_data['status']
-        result["title"] = text_clean(tndr_data['title'])
+        name, title = entity["name"], tndr_data['title']
+        if clean:
+            name, title = text_clean(name), text_clean(title)
+        clarif_until = vat = price = currency = price_uah = None
         if (ep := tndr_data.get('enquiryPeriod')) is not None:
-            enquiry_period = ep.get('clarificationsUntil')
-            result['clarifications_until'] = enquiry_period
+            clarif_until = ep.get('clarificationsUntil')
         if (value_data := tndr_data.get('value')) is not None:
-            result["price"] = value_data.get("amount")
+            price = value_data.get("amount")
             currency = value_data.get("currency")
-            result["currency"] = currency
             # f'{"бе" if tndr_data['value']["valueAddedTaxIncluded"] else ""}з ПДВ'
-            result["vat"] = None if (vat := value_data.get("valueAddedTaxIncluded")) is None else vat
+            vat = value_data.get("valueAddedTaxIncluded")
             if currency == "UAH":
-                result['price_uah'] = result["price"]
+                price_uah = price
             else:
-                result['price_uah'] = round(result['price'] * currency_dict[currency], 2)
-        else:
-            result['vat'] = result["price"] = result['currency'] = result['price_uah'] = None
+                rates = rates or default_rates()
+                rate = rates.rate(currency, date.fromisoformat(tdate)
+                                  if tdate else YESTERDAY)
+                if rate is not None:
+                    price_uah = round(price * rate, 2)
+        return (
+            entity["identifier"]["id"],
+            name,
+            mt,
+            mt + "." + tndr_data['status'],
+            clarif_until,
+            title,
+            tndr_data['tenderID'],
+            tndr_data['id'],
+            price,
+            price_uah,
+            currency,
+            vat,
+            tdate,
+            tndr_data.get('dateModified'))
     except Exception as e1:
         logging.error(tndr_data['id'])
         logging.critical(e1)
         raise
-    else:
-        return result
-
 
-def count_tenders_records(con):
-    COUNT_QRY = "SELECT COUNT(*) FROM tenders;"
-    return con.sql(COUNT_QRY).fetchone()[0]
 
 
-def duckdb_insert(data, database=DUCKDB_NAME,
-                  store_parquet=False):
-    try:
-        table = pa.Table.from_pylist(data, schema=tender_schema)
-        with duckdb.connect(database=database) as con:
-            pre_count = count_tenders_records(con)
-
-            con.register("tenders_data", table)
-            con.sql("INSERT INTO tenders "
-                    "SELECT * FROM tenders_data "
-                    "ON CONFLICT (id) DO NOTHING;")
-            
-            post_count = count_tenders_records(con)
-            inserted = post_count - pre_count
-            con.commit()
-    except ArrowInvalid as e:
-        err_file = "errdump.txt"
-        logging.error(f"Arrow error, investigate {err_file}")
-        with open(err_file, "w", encoding="utf-8") as f:
-            f.write(str(data))
-        raise
-    except Exception as e_:
-        logging.exception(e_)
-        inserted = 0
-    else:
-        if store_parquet:
-            pq.write_table(table, "output.parquet")
-        inserted = len(data)
-    return inserted
-
-logging.info("Database creation start")
-
-duckdb_create_string = """
-CREATE TABLE IF NOT EXISTS tenders (
-    entity_id VARCHAR,
-    entity_name VARCHAR,
-    proc_type VARCHAR,
-    status VARCHAR,
-    clarif_until VARCHAR,
-    title VARCHAR,
-    uaid VARCHAR,
-    id VARCHAR PRIMARY KEY,
-    price DECIMAL(12,2),
-    price_uah DECIMAL(12,2),
-    currency VARCHAR,
-    vat BOOLEAN,
-    date DATE);"""
-
-index_statements = [
-    "CREATE INDEX IF NOT EXISTS idx_tenders_date ON tenders(date);",
-    "CREATE INDEX IF NOT EXISTS idx_tenders_entity ON tenders(entity_id);",
-    "CREATE INDEX IF NOT EXISTS idx_tenders_proc ON tenders(proc_type);"
-]
-
-with duckdb.connect(DUCKDB_NAME) as con:
-    con.sql(duckdb_create_string)
-    for idx_sql in index_statements:
-        con.sql(idx_sql)
-
-    con.register("procedure_table", classifier_to_table(
-        PROCDICT, proc_schema))
-    con.sql("CREATE OR REPLACE TABLE procdict AS " \
-            "SELECT * FROM procedure_table;")
-
-    con.register("status_table", classifier_to_table(
-        STATUSDICT, status_schema))
-    
-    con.sql("CREATE OR REPLACE TABLE statusdict (" \
-            "status INTEGER PRIMARY KEY, status_name " \
-            "TEXT NOT NULL);")
-    con.sql("INSERT INTO statusdict " \
-            "SELECT * FROM status_table;")
-    con.commit()
-
-logging.info("DuckDB Database creation end")
-
-stop_date = datetime.fromisoformat(START_DATE) + timedelta(hours=24)
-STOP_DATE = datetime.combine(
-    YESTERDAY, datetime.min.time()).replace(tzinfo=KYIV_ZONE)
-stop_date = stop_date.astimezone(KYIV_ZONE)
-
-logging.info(f"Startdate is: {START_DATE}; "
-             f"Stopdate is: {stop_date.date().isoformat()}")
-
-offset = mk_offset_param(YESTERDAY)
-counter = 0
-stop = False
-tenders_list = []
-start_time = time.time()
-logging.info("IDs harvesting has begun")
-# print(API_URL + API_PATH)
-
-pbar = tqdm(total=None, desc="Fetching items x 100")
-
-
-while not stop:
-    try:
-        res = s.get(
-            API_URL + API_PATH,
-            params={"offset": offset},
-            verify=False  # cert='pem_cert.crt', # key=pem-chain.pem
-            )
-        res.raise_for_status()
-        json_data = res.json()
-        data_ = json_data['data']
-        tenders_list.extend(data_)
-
-        last_date = datetime.fromisoformat(data_[-1]['dateModified'])
-
-        counter += 1
-        pbar.update(len(data_))
-
-        if last_date >= stop_date:
-            stop = True
-            logging.info(f'StopDate {stop_date} is reached')
-            logging.info(f"Fetched total: {len(tenders_list)}")
-        offset = json_data["next_page"]["offset"]
-        time.sleep(SLEEP)
-    except (HTTPError, RequestException) as err:
-        logging.error(f"Request error occurred: {err}")
-        raise
-    except Exception as e:
-        raise
 
-pbar.close()
-
-end_time = round(time.time() - start_time, 2)
-logging.info(f"IDs harvesting complete.\n{len(tenders_list)} items "
-             f"have been harvested within {end_time} s.")
-
-yesterday_date = datetime.combine(
-    YESTERDAY, datetime.min.time(),
-    tzinfo=timezone.utc).astimezone(KYIV_ZONE)
-fresh = []
-tender_box = []
-counter = 0
-logging.info("Freshing has begun")
-start_time = time.time()
-
-for t in tqdm(tenders_list):
-    tid = t['id']
-    procurement_data = get_procurement(tid)  # Dict
-    if procurement_data is None:
-        continue
-    counter += 1
-    time.sleep(SLEEP)
-    tdate = get_tender_date(procurement_data)
-    if tdate < yesterday_date:
-        continue
-    tdate = tdate.date().isoformat()
-    p = tid, tdate
-    fresh.append(p)
-    tender_info = get_tender_info(procurement_data)
-    tender_info['date'] = tdate
-    tender_box.append(tender_info)
-    if counter % 500 == 0:
+class Collector:
+    """
+    Collects the tenders modified on `day` and dated `since` (by default,
+    `day`) or later, and the new versions of stored tenders dated up to
+    REFRESH_SPAN earlier, into `store` (and `lake`): the feed crawl, the
+    detail workers and the DuckDB writer run at once, joined by bounded
+    queues. With `until`, the feed is crawled from `day` up to now and
+    only the tenders dated `until` or earlier are kept.
+    With `replay`, recorded tenders are parsed instead of being
+    downloaded. The API session is opened on first use. `monitor` keeps
+    the peak memory of every stage; with its `limit` set, stored
+    tenders are looked up in the database instead of being loaded, and
+    `fresh` is moved to disk whenever the ceiling is reached.
+    """
+
+    def __init__(self, day: date, store: TenderStore,
+                 lake: Optional[ParquetLake] = None,
+                 recorder: Optional[Recorder] = None,
+                 replay: Optional[Replay] = None,
+                 http: Optional[Transport] = None,
+                 rates: Optional[ExchangeRates] = None,
+                 since: Optional[date] = None,
+                 until: Optional[date] = None,
+                 known: Optional[Dict[str, Optional[int]]] = None,
+                 limiter: Optional[AdaptiveRateLimiter] = None,
+                 monitor: Optional[MemoryMonitor] = None,
+                 checkpoint_path=CHECKPOINT_FILE,
+                 progress: bool = True,
+                 publish: bool = True):
+        self.day = day
+        self.day_iso = day.isoformat()
+        self.since = since or day
+        self.until = until
+        self.store = store
+        self.lake = lake
+        self.recorder = recorder
+        self.replay = replay
+        self._http = http
+        self._rates = rates
+        self.limiter = limiter or AdaptiveRateLimiter(
+            RATE, MIN_RATE, MAX_RATE)
+        self.retry_budget = RetryBudget(RETRY_BUDGET)
+        self.progress = progress
+        self.publish_snapshots = publish
+        self.until_iso = until.isoformat() if until is not None else None
+        self.dates = TenderDateResolver(datetime.combine(
+            self.since, datetime.min.time(),
+            tzinfo=timezone.utc).astimezone(KYIV_ZONE))
+        self.fresh = []
+        self.fresh_spill = FRESH_SPILL
+        self.builder = TenderBatchBuilder(transforms={
+            "entity_name": text_clean_batch,
+            "title": text_clean_batch})
+        self.sent_batches: List[pa.RecordBatch] = []
+        self.confirmed = 0
+        self.counter = 0
+        self.inserted = 0
+        self.stats: Counter = Counter()
+        self.known = known
+        # Stored tenders selected again as modified, kept whatever their
+        # date: they may be dated up to REFRESH_SPAN before `since`
+        self.refetched: Set[str] = set()
+        self.monitor = monitor or MemoryMonitor()
+        self.checkpoint_path = checkpoint_path
+        self.checkpoint = Checkpoint(self.day_iso, checkpoint_path)
+        self.writer: Optional[BatchWriter] = None
+
+    @property
+    def http(self) -> Transport:
+        if self._http is None:
+            # One keep-alive connection per detail worker plus one for
+            # the feed
+            urllib3.disable_warnings(InsecureRequestWarning)
+            self._http = Transport(pool_size=WORKERS + 1)
+        return self._http
+
+    @property
+    def rates(self) -> ExchangeRates:
+        if self._rates is None:
+            self._rates = ExchangeRates(self.store.con)
+        return self._rates
+
+    def get_procurement(self, tid_: str) -> Optional[dict]:
         try:
-            ins: int = duckdb_insert(tender_box)
-            if ins == 0:
-                raise ValueError("No data inserted. All data is LOST.")
-        except Exception as e:
-            logging.error("No data inserted. Data LOST, stopped.")
+            res_ = get_with_retries(
+                self.http, f"{API_URL}{API_PATH}/{tid_}", self.limiter,
+                self.retry_budget, timeout=REQUEST_TIMEOUT)
+            res_.raise_for_status()
+            if self.recorder is None:
+                return decode_tender(res_.content)
+            data = res_.json().get('data')
+            if data is not None:
+                self.recorder.tender(data)
+            return data
+        except (requests.RequestException, ValueError, KeyError) as e:
+            logging.error(f"Error fetching procurement {tid_}: {e}")
+            return
+
+    def crawl_feed(self, offset: str, stop_date: datetime,
+                   on_page: Optional[Callable] = None) -> Iterator[dict]:
+        """
+        Yields feed items page by page until `stop_date` is reached.
+        `on_page(offset, ids, next_offset)` is called before a page is
+        yielded.
+        """
+        fetched = 0
+        start_time = time.time()
+        logging.info("IDs harvesting has begun")
+        while True:
+            try:
+                res = get_with_retries(
+                    self.http, API_URL + API_PATH, self.limiter,
+                    self.retry_budget,
+                    params={"offset": offset, "opt_fields": FEED_OPT_FIELDS},
+                    # The feed has always been read without certificate
+                    # verification; detail requests are verified
+                    verify=False,  # cert='pem_cert.crt', # key=pem-chain.pem
+                    timeout=REQUEST_TIMEOUT)
+                res.raise_for_status()
+                json_data = res.json()
+            except (HTTPError, RequestException) as err:
+                logging.error(f"Request error occurred: {err}")
+                raise
+            if self.recorder is not None:
+                self.recorder.feed_page(offset, json_data)
+            data_ = json_data['data']
+            next_offset = json_data.get("next_page", {}).get("offset", offset)
+            reached = not data_ or datetime.fromisoformat(
+                data_[-1]['dateModified']) >= stop_date
+            if reached:
+                # Items past the window belong to the next day's run
+                data_ = [t for t in data_ if datetime.fromisoformat(
+                    t['dateModified']) < stop_date]
+            if on_page is not None:
+                on_page(offset, [t['id'] for t in data_], next_offset)
+            yield from data_
+            fetched += len(data_)
+            if reached:
+                logging.info(f'StopDate {stop_date} is reached')
+                break
+            offset = next_offset
+        end_time = round(time.time() - start_time, 2)
+        logging.info(f"IDs harvesting complete.\n{fetched} items "
+                     f"have been harvested within {end_time} s.")
+
+    def select_ids(self, items: Iterator[dict]) -> Iterator[str]:
+        """
+        Yields IDs of the feed items worth a detail request
+        """
+        if self.known is not None:
+            yield from self._select_ids(items, self.known)
+            return
+        items = iter(items)
+        while chunk := list(islice(items, LOOKUP_CHUNK)):
+            known = self.store.modified([item['id'] for item in chunk],
+                                        self.since - REFRESH_SPAN)
+            yield from self._select_ids(chunk, known)
+
+    def _select_ids(self, items: Iterable[dict],
+                    known: Dict[str, Optional[int]]) -> Iterator[str]:
+        for item in items:
+            tid = item['id']
+            if tid in self.checkpoint.processed:
+                self.stats['resumed'] += 1
+                continue
+            if tid in known:
+                # Stored already: fetched again only if modified since
+                stored = known[tid]
+                if stored is not None and get_modified(item) <= stored:
+                    self.stats['known'] += 1
+                    self.checkpoint.done(tid)
+                    continue
+                self.stats['modified'] += 1
+                self.refetched.add(tid)
+                yield tid
+                continue
+            created = get_created_date(item)
+            if created is not None and created < self.since - CREATED_GRACE:
+                self.stats['created_before'] += 1
+                self.checkpoint.done(tid)
+                continue
+            if self.until is not None and created is not None \
+                    and created > self.until + CREATED_GRACE:
+                self.stats['created_after'] += 1
+                self.checkpoint.done(tid)
+                continue
+            yield tid
+
+    def write_batch(self, batch: pa.RecordBatch) -> int:
+        written = self.store.insert(batch)
+        if self.lake is not None:
+            self.lake.append(written)
+        n, replaced = written.num_rows, self.store.timings[-1].replaced
+        logging.info(f"inserted {n - replaced} / replaced {replaced} / "
+                     f"unchanged {batch.num_rows - n}")
+        return n
+
+    def flush(self):
+        try:
+            batch = self.builder.build()
+        except ArrowInvalid:
+            err_file = "errdump.txt"
+            logging.error(f"Arrow error, investigate {err_file}")
+            with open(err_file, "w", encoding="utf-8") as f:
+                f.write(str(self.builder.to_pydict()))
             raise
+        self.writer.put(batch)
+        if self.replay is None:
+            # Kept for the checkpoint until the writer confirms them
+            self.sent_batches.append(batch)
+
+    def save_checkpoint(self):
+        if self.replay is not None:
+            return
+        # Batches handed to the writer but not written yet stay pending
+        written = self.writer.batches
+        del self.sent_batches[:written - self.confirmed]
+        self.confirmed = written
+        pending = self.builder.to_pydict()
+        for batch in self.sent_batches:
+            for name, values in self.builder.raw(batch).items():
+                pending[name].extend(values)
+        self.checkpoint.save(pending, dict(self.stats, checked=self.counter))
+
+    def relieve(self):
+        """
+        Gets under the memory ceiling once the RSS has reached it: `fresh`
+        is moved to its spill file and the freed heap is handed back to
+        the OS
+        """
+        reached = self.monitor.current
+        self.stats['relieved'] += 1
+        if self.fresh:
+            with open(self.fresh_spill, "a", encoding="utf-8") as f:
+                f.writelines(f"{tid}\t{tdate}\n" for tid, tdate in self.fresh)
+            self.fresh.clear()
+        release()
+        after = self.monitor.sample()
+        if self.stats['relieved'] == 1:
+            logging.warning(f"Memory ceiling reached at {reached / MIB:.0f} "
+                            f"MiB, {after / MIB:.0f} MiB after relief")
+
+    def fresh_items(self) -> List[Tuple[str, str]]:
+        """
+        `(id, date)` of the tenders parsed by this run, including the
+        spilled ones
+        """
+        items = []
+        if self.monitor.limit is not None and os.path.isfile(
+                self.fresh_spill):
+            with open(self.fresh_spill, encoding="utf-8") as f:
+                items = [tuple(line.rstrip("\n").split("\t"))
+                         for line in f]
+        return items + self.fresh
+
+    def publish(self, complete: bool = False):
+        """
+        Publishes a read-only snapshot of the store for the bot and
+        other readers; only the one published at the end of the run is
+        marked `complete`
+        """
+        if not self.publish_snapshots:
+            return
+        try:
+            path = self.store.snapshot(self.since - SNAPSHOT_SPAN,
+                                       day=self.day, complete=complete)
+        except (duckdb.Error, OSError) as e:
+            logging.error(f"Snapshot is not published: {e}")
         else:
-            logging.info(f"checked {counter} / inserted {ins}")
-            tender_box = []
-
-duckdb_insert(tender_box)
-
-
-total_seconds = time.time() - start_time
-hours, minutes, seconds = seconds_to_hms(total_seconds)
+            logging.info(f"Snapshot published to {path}")
+
+    def resume(self) -> Optional[str]:
+        """
+        Restores the state saved by an interrupted run of the same day;
+        returns the feed offset to continue from
+        """
+        checkpoint = Checkpoint.load(self.day_iso, self.checkpoint_path)
+        if checkpoint is None:
+            logging.warning("No checkpoint to resume from, starting over")
+            return None
+        self.checkpoint = checkpoint
+        self.stats.update(checkpoint.stats)
+        self.counter = self.stats.pop('checked', 0)
+        if checkpoint.pending:
+            self.builder.extend(checkpoint.pending)
+        logging.info(f"Resuming from offset {checkpoint.offset}: "
+                     f"{len(checkpoint.processed)} processed IDs, "
+                     f"{len(self.builder)} pending records")
+        return checkpoint.offset
+
+    def tenders(self, start_offset: str) -> Iterator[Tuple[str, dict]]:
+        if self.replay is not None:
+            logging.info(f"Replaying {self.replay.directory}")
+            return self.replay.tenders()
+        if self.until is not None:
+            # Up to the end of the feed
+            stop_date = datetime.now(KYIV_ZONE)
+        else:
+            stop_date = datetime.fromisoformat(self.day_iso) \
+                + timedelta(hours=24)
+            stop_date = stop_date.astimezone(KYIV_ZONE)
+        logging.info(f"Startdate is: {self.day_iso}; "
+                     f"Stopdate is: {stop_date.date().isoformat()}")
+        feed = background(
+            self.crawl_feed(start_offset, stop_date, self.checkpoint.page),
+            maxsize=QUEUE_SIZE)
+        return fetch_concurrently(self.get_procurement, self.select_ids(feed),
+                                  workers=WORKERS)
+
+    def run(self, resume: bool = False) -> int:
+        """
+        Collects the day; returns the number of written tenders
+        """
+        monitor = self.monitor
+        start_offset = None
+        if resume and self.replay is None:
+            start_offset = self.resume()
+        if start_offset is None and monitor.limit is not None \
+                and os.path.isfile(self.fresh_spill):
+            # Left by an earlier run that is not continued
+            os.remove(self.fresh_spill)
+        start_offset = start_offset or mk_offset_param(self.day)
+
+        with monitor.stage("known"):
+            if self.known is None and monitor.limit is None:
+                self.known = self.store.known(self.since - REFRESH_SPAN)
+        if self.known is not None:
+            logging.info(f"{len(self.known)} tenders are already stored")
+        else:
+            logging.info("Stored tenders are looked up in the database")
 
-logging.info(f"Fresh complete. {len(fresh)} items has checked within {hours} hours, "
-             f"{minutes} minutes, and {seconds} seconds.")
-with open("fresh.pickle", "wb") as f:
-    pickle.dump(fresh, f)
+        logging.info("Freshing has begun")
+        start_time = time.time()
+        tenders = self.tenders(start_offset)
+        self.writer = BatchWriter(self.write_batch)
+        try:
+            with monitor.stage("collect"):
+                tenders = tqdm(tenders, disable=not self.progress)
+                for n, (tid, procurement_data) in enumerate(tenders, 1):
+                    if procurement_data is not None:
+                        self.counter += 1
+                        tdate = self.dates.resolve(
+                            procurement_data,
+                            cutoff=tid not in self.refetched)
+                        if tdate is not None and self.until_iso is not None \
+                                and tdate > self.until_iso:
+                            self.stats['dated_after'] += 1
+                            tdate = None
+                        if tdate is not None:
+                            # One string per date, shared by all entries
+                            p = tid, sys.intern(tdate)
+                            self.fresh.append(p)
+                            self.builder.append(get_tender_info(
+                                procurement_data, tdate, rates=self.rates,
+                                clean=False))
+                    self.checkpoint.done(tid)
+                    self.refetched.discard(tid)
+                    if len(self.builder) >= BATCH_SIZE:
+                        self.flush()
+                    if n % CHECKPOINT_EVERY == 0:
+                        self.save_checkpoint()
+                        self.publish()
+                    if n % RELIEF_EVERY == 0 and monitor.over():
+                        self.relieve()
+
+                if len(self.builder):
+                    self.flush()
+                self.inserted = self.writer.close()
+            with monitor.stage("finish"):
+                self.publish(complete=True)
+                if self.lake is not None:
+                    self.lake.compact()
+        except BaseException:
+            # No writes into the store once the run has failed
+            self.writer.abort()
+            if self.replay is None:
+                self.save_checkpoint()
+                logging.error(f"Run interrupted, checkpoint saved to "
+                              f"{self.checkpoint.path}; restart with --resume")
+            raise
+        else:
+            if self.replay is None:
+                self.checkpoint.clear()
+        finally:
+            if self.recorder is not None:
+                self.recorder.close()
+
+        total_seconds = time.time() - start_time
+        hours, minutes, seconds = seconds_to_hms(total_seconds)
+        logging.info(f"Fresh complete. {self.counter} items have been "
+                     f"checked, {self.inserted} written within {hours} "
+                     f"hours, {minutes} minutes, and {seconds} seconds.")
+        if self._http is not None:
+            logging.info(f"Final request rate {self.limiter.rate:.2f} "
+                         f"req/s, {self.retry_budget.used} retries used")
+            logging.info(f"API traffic: {self._http.report()}")
+        logging.info(f"Detail requests skipped as created before the day: "
+                     f"{self.stats['created_before']}, as stored unchanged: "
+                     f"{self.stats['known']}, as already processed: "
+                     f"{self.stats['resumed']}; stored tenders fetched "
+                     f"again as modified: {self.stats['modified']}")
+        if self.until is not None:
+            logging.info(f"Tenders dated after {self.until} left out: "
+                         f"{self.stats['created_after']} by their creation "
+                         f"date, {self.stats['dated_after']} after the "
+                         "detail request")
+        if self.stats['relieved']:
+            logging.info(f"Memory ceiling reached {self.stats['relieved']} "
+                         "times")
+        monitor.report()
+        return self.inserted
+
+
+def main(argv: Optional[Sequence[str]] = None):
+    args = parse_args(argv)
+    setup_logging()
+
+    replay = Replay(args.replay) if args.replay else None
+    # The collected day: yesterday, or the day of the replayed recording
+    day = date.fromisoformat(replay.day) if replay is not None else YESTERDAY
+    recorder = Recorder(day.isoformat()) \
+        if args.record and replay is None else None
+
+    logging.info("Database creation start")
+    limit = args.max_memory * MIB if args.max_memory else None
+    monitor = MemoryMonitor(limit)
+    store = TenderStore(
+        args.database, history=args.history,
+        memory_limit=int(limit * DUCKDB_MEMORY_SHARE) if limit else None)
+    try:
+        store.create_tables()
+        logging.info("DuckDB Database creation end")
+        if args.rebuild_summaries:
+            differ = store.rebuild_aggregates()
+            logging.info(f"Daily summaries rebuilt, {differ} rows differed "
+                         "from the incrementally updated ones")
+            return
+        lake = ParquetLake() if args.parquet else None
+        collector = Collector(day, store, lake=lake, recorder=recorder,
+                              replay=replay, monitor=monitor)
+        collector.run(resume=args.resume)
+    finally:
+        store.report()
+        store.close()
+
+    with open("fresh.pickle", "wb") as f:
+        pickle.dump(collector.fresh_items(), f)
+    if os.path.isfile(collector.fresh_spill):
+        os.remove(collector.fresh_spill)
+
+
+if __name__ == "__main__":
+    main()
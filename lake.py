@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+import logging
+import os
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import Iterable, List, Set
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from utils import LAKE_DIR
+
+
+COMPRESSION = "zstd"
+ROW_GROUP_SIZE = 128 * 1024
+# Partitions with at least this many part files are merged at the end
+# of a run
+COMPACT_MIN_FILES = 2
+
+
+def conform(table: pa.Table, schema: pa.Schema) -> pa.Table:
+    """
+    `table` in the layout of `schema`: columns are matched by name, cast
+    to its types, and those it lacks are added as nulls
+    """
+    columns = [table.column(f.name).cast(f.type)
+               if f.name in table.schema.names
+               else pa.nulls(table.num_rows, f.type)
+               for f in schema]
+    return pa.Table.from_arrays(columns, schema=schema)
+
+
+class ParquetLake:
+    """
+    Hive-partitioned Parquet store of tenders, one `date=YYYY-MM-DD`
+    directory per tender date. Every append writes new part files under
+    a temporary name and renames them into place, so readers never see
+    a half-written file. The `date` column lives in the directory name
+    only; DuckDB restores it from there and prunes partitions on it.
+    """
+
+    def __init__(self, root=LAKE_DIR):
+        self.root = Path(root)
+        self.touched: Set[str] = set()
+
+    def partition(self, day: str) -> Path:
+        return self.root / f"date={day}"
+
+    def parts(self, day: str) -> List[Path]:
+        return sorted(self.partition(day).glob("*.parquet"))
+
+    def _write(self, table: pa.Table, directory: Path) -> Path:
+        directory.mkdir(parents=True, exist_ok=True)
+        name = (f"part-{datetime.now():%Y%m%d%H%M%S}-"
+                f"{uuid.uuid4().hex[:8]}.parquet")
+        tmp = directory / f".{name}.tmp"
+        pq.write_table(table, tmp, compression=COMPRESSION,
+                       row_group_size=ROW_GROUP_SIZE,
+                       write_statistics=True)
+        os.replace(tmp, directory / name)
+        return directory / name
+
+    def append(self, table: pa.Table) -> int:
+        """
+        Writes the rows of `table` into their date partitions; returns
+        the number of rows written
+        """
+        if table.num_rows == 0:
+            return 0
+        dates = table.column("date")
+        payload = table.drop_columns(["date"])
+        for day in pc.unique(dates).to_pylist():
+            if day is None:
+                continue
+            day = str(day)
+            mask = pc.equal(pc.cast(dates, pa.string()), day)
+            self._write(payload.filter(mask), self.partition(day))
+            self.touched.add(day)
+        return table.num_rows
+
+    def compact(self, days: Iterable[str] = ()):
+        """
+        Merges the part files of each partition from `days` (by default,
+        those touched by this process) into a single file
+        """
+        for day in sorted(days or self.touched):
+            parts = self.parts(day)
+            if len(parts) < COMPACT_MIN_FILES:
+                continue
+            tables = [pq.read_table(p, partitioning=None) for p in parts]
+            # Parts written before a column changed type take the types
+            # of the newest part
+            newest = max(range(len(parts)),
+                         key=lambda i: parts[i].stat().st_mtime_ns)
+            schema = tables[newest].schema
+            table = pa.concat_tables([conform(t, schema) for t in tables])
+            self._write(table, self.partition(day))
+            for p in parts:
+                p.unlink()
+            logging.info(f"Lake partition {day}: {len(parts)} files "
+                         f"compacted, {table.num_rows} rows")
+
+    def attach(self, con, view: str = "tenders_lake"):
+        """
+        Creates a DuckDB view over the lake; filters on `date` only read
+        the matching partitions
+        """
+        pattern = (self.root.resolve() / "date=*" / "*.parquet").as_posix()
+        con.sql(f"CREATE OR REPLACE VIEW {view} AS "
+                f"SELECT * FROM read_parquet('{pattern}', "
+                "hive_partitioning = true, "
+                "hive_types = {'date': DATE});")
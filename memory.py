@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+import ctypes
+import gc
+import logging
+import os
+import resource
+import sys
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+
+SAMPLE_INTERVAL = 0.2  # seconds between two RSS readings
+MIB = 1024 * 1024
+
+try:
+    # glibc keeps freed memory in its arenas instead of handing it back
+    _malloc_trim = ctypes.CDLL(None).malloc_trim
+except (OSError, AttributeError):  # other C libraries
+    _malloc_trim = None
+
+
+def rss() -> int:
+    """
+    Resident set size of this process in bytes; where /proc is not
+    available, the peak reached so far
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # KiB on Linux, bytes on macOS
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def release() -> int:
+    """
+    Collects garbage and hands the freed heap back to the OS where the C
+    library allows it; returns the RSS afterwards
+    """
+    gc.collect()
+    if _malloc_trim is not None:
+        _malloc_trim(0)
+    return rss()
+
+
+class MemoryMonitor:
+    """
+    Keeps the peak RSS of every stage of a run, entered with `stage`;
+    while a stage is open, the RSS is sampled in a daemon thread. With
+    `limit` (bytes), `over` tells that the last reading reached the
+    ceiling, so the caller can move pending work to disk.
+    """
+
+    def __init__(self, limit: Optional[int] = None,
+                 interval: float = SAMPLE_INTERVAL):
+        self.limit = limit
+        self.interval = interval
+        self.peaks: Dict[str, int] = {}
+        self.current = rss()
+        self._stage: Optional[str] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def _start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _halt(self):
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def sample(self) -> int:
+        self.current = current = rss()
+        if (stage := self._stage) is not None:
+            self.peaks[stage] = max(self.peaks.get(stage, 0), current)
+        return current
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        previous, self._stage = self._stage, name
+        if previous is None:
+            self._start()
+        self.sample()
+        try:
+            yield
+        finally:
+            self.sample()
+            self._stage = previous
+            if previous is None:
+                self._halt()
+
+    def over(self) -> bool:
+        return self.limit is not None and self.current >= self.limit
+
+    def report(self):
+        if self.peaks:
+            logging.info("Peak RSS by stage: " + ", ".join(
+                f"{name} {peak / MIB:.0f} MiB"
+                for name, peak in self.peaks.items()))
@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+import asyncio
+import html
+import json
+import logging
+import os
+import re
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Tuple
+
+import requests
+import telebot
+from telebot.apihelper import ApiTelegramException
+
+
+# Telegram limits the text left after HTML parsing, in UTF-16 code units
+MESSAGE_LIMIT = 4096
+SEPARATOR = "\n\n"
+SEND_INTERVAL = 0.64  # seconds between two messages to one chat
+MAX_ATTEMPTS = 5
+BACKOFF_BASE = 1.0  # seconds, doubled on every network error
+STATE_FILE = "publish_state.json"
+STATE_KEEP = 30  # publications remembered per chat
+
+_TAG_RE = re.compile(r"<[^>]*>")
+
+
+def telegram_length(text: str) -> int:
+    """
+    Length of an HTML message as Telegram counts it against the limit
+    """
+    plain = html.unescape(_TAG_RE.sub("", text))
+    return len(plain.encode("utf-16-le")) // 2
+
+
+def pack(pieces: Iterable[str], suffix: str = "",
+         limit: int = MESSAGE_LIMIT) -> List[str]:
+    """
+    Joins `pieces` with blank lines into as few messages as fit into
+    `limit`, in one pass; `suffix` is appended to the last message, or
+    sent on its own if it does not fit there
+    """
+    sep_len = telegram_length(SEPARATOR)
+    messages: List[str] = []
+    portion: List[str] = []
+    length = 0
+    for piece in pieces:
+        piece_len = telegram_length(piece)
+        if portion and length + sep_len + piece_len > limit:
+            messages.append(SEPARATOR.join(portion))
+            portion, length = [], 0
+        length += piece_len + (sep_len if portion else 0)
+        portion.append(piece)
+    if portion:
+        messages.append(SEPARATOR.join(portion))
+    if suffix:
+        if messages and length + telegram_length(suffix) <= limit:
+            messages[-1] += suffix
+        else:
+            messages.append(suffix.lstrip())
+    return messages
+
+
+class Publisher:
+    """
+    Posts the messages of a publication (`key`, e.g. the day of a top)
+    to one chat, in order, from an asyncio queue. Flood-control errors
+    are waited out for the `retry_after` Telegram asks for, network
+    errors are retried with backoff. The number of delivered messages is
+    saved after each one, so a failed publication resumes from the
+    first undelivered message instead of posting everything again.
+    """
+
+    def __init__(self, bot: telebot.TeleBot, chat_id,
+                 state_path=STATE_FILE, interval: float = SEND_INTERVAL):
+        self.bot = bot
+        self.chat_id = chat_id
+        self.state_path = Path(state_path)
+        self.interval = interval
+
+    def _load(self) -> dict:
+        try:
+            return json.loads(self.state_path.read_text())
+        except (OSError, ValueError):
+            return {}
+
+    def delivered(self, key: str) -> int:
+        """
+        Messages of the publication `key` already delivered to the chat
+        """
+        return self._load().get(str(self.chat_id), {}).get(key, 0)
+
+    def _save(self, key: str, delivered: int):
+        state = self._load()
+        chat = state.setdefault(str(self.chat_id), {})
+        chat.pop(key, None)
+        chat[key] = delivered
+        for old in list(chat)[:-STATE_KEEP]:
+            del chat[old]
+        tmp = self.state_path.with_name(f".{self.state_path.name}.tmp")
+        tmp.write_text(json.dumps(state))
+        os.replace(tmp, self.state_path)
+
+    async def _send(self, text: str):
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            try:
+                await asyncio.to_thread(
+                    self.bot.send_message, self.chat_id, text,
+                    parse_mode='HTML', disable_web_page_preview=True)
+                return
+            except ApiTelegramException as e:
+                retry_after = (e.result_json.get("parameters")
+                               or {}).get("retry_after")
+                if e.error_code != 429 or retry_after is None \
+                        or attempt == MAX_ATTEMPTS:
+                    raise
+                logging.warning(f"Flood control, retry in {retry_after} s")
+                await asyncio.sleep(retry_after)
+            except requests.RequestException as e:
+                if attempt == MAX_ATTEMPTS:
+                    raise
+                delay = BACKOFF_BASE * 2 ** (attempt - 1)
+                logging.warning(f"Telegram request failed ({e}), "
+                                f"retry in {delay} s")
+                await asyncio.sleep(delay)
+
+    async def _deliver(self, key: str, queue: asyncio.Queue):
+        while (item := await queue.get()) is not None:
+            number, text = item
+            await self._send(text)
+            self._save(key, number + 1)
+            await asyncio.sleep(self.interval)
+
+    async def publish(self, key: str, messages: List[str]) -> int:
+        """
+        Posts the messages of `key` not delivered yet; returns how many
+        were posted
+        """
+        start = self.delivered(key)
+        if start >= len(messages):
+            logging.info(f"{key} is already published to {self.chat_id}")
+            return 0
+        if start:
+            logging.info(f"Resuming {key} from message {start + 1}")
+        queue: asyncio.Queue = asyncio.Queue()
+        for item in enumerate(messages[start:], start):
+            queue.put_nowait(item)
+        queue.put_nowait(None)
+        await self._deliver(key, queue)
+        logging.info(f"{key}: {len(messages) - start} messages sent "
+                     f"to {self.chat_id}")
+        return len(messages) - start
+
+
+async def _publish_chat(publisher: Publisher,
+                        publications: List[Tuple[str, List[str]]]) -> int:
+    sent = 0
+    for key, messages in publications:
+        sent += await publisher.publish(key, messages)
+    return sent
+
+
+async def _fan_out(bot: telebot.TeleBot, chats: Dict,
+                   state_path) -> List:
+    return await asyncio.gather(
+        *(_publish_chat(Publisher(bot, chat_id, state_path), publications)
+          for chat_id, publications in chats.items()),
+        return_exceptions=True)
+
+
+def fan_out(bot: telebot.TeleBot,
+            publications: Iterable[Tuple[Any, str, List[str]]],
+            state_path=STATE_FILE) -> int:
+    """
+    Posts `(chat_id, key, messages)` publications: one after another
+    within a chat, all chats at once. A failed chat does not stop the
+    others; the first error is raised once they are done. Returns the
+    number of messages posted.
+    """
+    chats: Dict[Any, List[Tuple[str, List[str]]]] = {}
+    for chat_id, key, messages in publications:
+        chats.setdefault(chat_id, []).append((key, messages))
+    results = asyncio.run(_fan_out(bot, chats, state_path))
+    errors = []
+    for chat_id, result in zip(chats, results):
+        if isinstance(result, BaseException):
+            logging.error(f"Posting to {chat_id} failed: {result}")
+            errors.append(result)
+    if errors:
+        raise errors[0]
+    return sum(results)
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+import gzip
+import json
+import logging
+import threading
+import zlib
+from pathlib import Path
+from typing import Callable, Iterator, Tuple
+
+from decoder import decode_tender
+from utils import RECORD_DIR
+
+
+SEGMENT_LINES = 10000
+MANIFEST = "manifest.json"
+
+
+class _Segments:
+    """
+    Append-only sequence of gzip-compressed NDJSON files
+    `<kind>-NNNNNN.ndjson.gz`; a new file is started every
+    `SEGMENT_LINES` lines and on every run.
+    """
+
+    def __init__(self, directory: Path, kind: str):
+        self.directory = directory
+        self.kind = kind
+        existing = sorted(directory.glob(f"{kind}-*.ndjson.gz"))
+        self._number = int(existing[-1].name[len(kind) + 1:][:6]) \
+            if existing else 0
+        self._file = None
+        self._lines = 0
+
+    def write(self, obj):
+        if self._file is None or self._lines >= SEGMENT_LINES:
+            self.close()
+            self._number += 1
+            self._file = gzip.open(
+                self.directory / f"{self.kind}-{self._number:06d}.ndjson.gz",
+                "wt", encoding="utf-8")
+            self._lines = 0
+        self._file.write(json.dumps(obj, ensure_ascii=False))
+        self._file.write("\n")
+        self._lines += 1
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class Recorder:
+    """
+    Records raw feed pages and tender documents of one collected day
+    under `root/<day>/`. Safe to call from several worker threads.
+    """
+
+    def __init__(self, day: str, root=RECORD_DIR):
+        self.directory = Path(root) / day
+        self.directory.mkdir(parents=True, exist_ok=True)
+        (self.directory / MANIFEST).write_text(json.dumps({"day": day}))
+        self._feed = _Segments(self.directory, "feed")
+        self._tenders = _Segments(self.directory, "tenders")
+        self._lock = threading.Lock()
+
+    def feed_page(self, offset: str, page: dict):
+        with self._lock:
+            self._feed.write({"offset": offset, "page": page})
+
+    def tender(self, data: dict):
+        with self._lock:
+            self._tenders.write(data)
+
+    def close(self):
+        with self._lock:
+            self._feed.close()
+            self._tenders.close()
+
+
+class Replay:
+    """
+    Reads back the tender documents `Recorder` has written, in recording
+    order; the feed pages are kept for reference only
+    """
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        manifest = json.loads((self.directory / MANIFEST).read_text())
+        self.day: str = manifest["day"]
+
+    def _read(self, kind: str,
+              decode: Callable = json.loads) -> Iterator:
+        for path in sorted(self.directory.glob(f"{kind}-*.ndjson.gz")):
+            try:
+                with gzip.open(path, "rb") as f:
+                    for line in f:
+                        yield decode(line)
+            except (EOFError, zlib.error, ValueError) as e:
+                # The last segment of a crashed run may be truncated
+                logging.warning(f"Replay: {path} is truncated ({e})")
+
+    def tenders(self) -> Iterator[Tuple[str, dict]]:
+        tenders = self._read(
+            "tenders", lambda line: decode_tender(line, envelope=False))
+        for data in tenders:
+            # Recordings made before empty responses were skipped
+            if data is not None:
+                yield data["id"], data
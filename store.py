@@ -0,0 +1,787 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+import logging
+import os
+import threading
+import time
+from datetime import date
+from pathlib import Path
+from typing import (
+    Callable, Dict, List, NamedTuple, Optional, Sequence, Set, Tuple,
+    Union)
+
+import duckdb
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from classifiers import CURRENCIES, PROCDICT, STATUSDICT
+from memory import MIB
+from utils import DUCKDB_NAME
+
+
+# Low-cardinality codes: dictionary arrays in Arrow, ENUMs in DuckDB
+code_type = pa.dictionary(pa.int32(), pa.string())
+
+tender_schema = pa.schema([
+    ("entity_id", pa.string()),
+    ("entity_name", pa.string()),
+    ("proc_type", code_type),
+    ("status", code_type),
+    ('clarif_until', pa.timestamp("us", tz="UTC")),
+    ("title", pa.string()),
+    ("uaid", pa.string()),
+    ("id", pa.string()),
+    ("price", pa.float64()),
+    ("price_uah", pa.float64()),
+    ("currency", code_type),
+    ("vat", pa.bool_()),
+    ("date", pa.date32()),
+    ("date_modified", pa.timestamp("us", tz="UTC")),
+    ])
+
+proc_schema = pa.schema([
+    ("procedure", pa.string()),
+    ("procedure_name", pa.string()),
+    ])
+
+status_schema = pa.schema([
+    ("status", pa.string()),
+    ("status_name", pa.string()),
+    ])
+
+rates_schema = pa.schema([
+    ("currency", pa.string()),
+    ("date", pa.date32()),
+    ("rate", pa.float64()),
+    ])
+
+# Values the ENUM types start with; values met in the data later are
+# added by `widen_enums`
+ENUM_SEEDS = {
+    "proc_type": tuple(dict(PROCDICT)),
+    "status": tuple(dict(STATUSDICT)),
+    "currency": CURRENCIES}
+# ENUM columns by table and the ENUM type they share
+ENUM_COLUMNS = {
+    "tenders": {"proc_type": "proc_type", "status": "status",
+                "currency": "currency"},
+    "daily_top": {"proc_type": "proc_type", "status": "status",
+                  "currency": "currency"},
+    "tender_history": {"proc_type": "proc_type", "status": "status",
+                       "currency": "currency"}}
+
+# `{proc_type}`, `{status}` and `{currency}` are the ENUM types
+duckdb_create_string = """
+CREATE TABLE IF NOT EXISTS tenders (
+    entity_id VARCHAR,
+    entity_name VARCHAR,
+    proc_type {proc_type},
+    status {status},
+    clarif_until TIMESTAMPTZ,
+    title VARCHAR,
+    uaid VARCHAR,
+    id VARCHAR PRIMARY KEY,
+    price DECIMAL(12,2),
+    price_uah DECIMAL(12,2),
+    currency {currency},
+    vat BOOLEAN,
+    date DATE,
+    date_modified TIMESTAMPTZ);"""
+
+# Versions of tenders replaced by later ones, kept with `--history`
+history_create_string = """
+CREATE TABLE IF NOT EXISTS tender_history (
+    entity_id VARCHAR,
+    entity_name VARCHAR,
+    proc_type {proc_type},
+    status {status},
+    clarif_until TIMESTAMPTZ,
+    title VARCHAR,
+    uaid VARCHAR,
+    id VARCHAR,
+    price DECIMAL(12,2),
+    price_uah DECIMAL(12,2),
+    currency {currency},
+    vat BOOLEAN,
+    date DATE,
+    date_modified TIMESTAMPTZ);"""
+
+dictionaries_create_strings = [
+    """
+CREATE OR REPLACE TABLE procdict (
+    procedure {proc_type} PRIMARY KEY,
+    procedure_name VARCHAR NOT NULL);""",
+    """
+CREATE OR REPLACE TABLE statusdict (
+    status {status} PRIMARY KEY,
+    status_name VARCHAR NOT NULL);""",
+]
+
+rates_create_string = """
+CREATE TABLE IF NOT EXISTS exchange_rates (
+    currency VARCHAR,
+    date DATE,
+    rate DOUBLE,
+    PRIMARY KEY (currency, date));"""
+
+# Per-day aggregates kept up to date by every insert; NULL grouping
+# values are stored as '' because they are part of the key
+aggregates_create_strings = [
+    """
+CREATE TABLE IF NOT EXISTS daily_summary (
+    date DATE,
+    proc_type VARCHAR,
+    currency VARCHAR,
+    tenders BIGINT,
+    total_uah DECIMAL(18,2),
+    PRIMARY KEY (date, proc_type, currency));""",
+    """
+CREATE TABLE IF NOT EXISTS daily_top (
+    rank INTEGER,
+    entity_id VARCHAR,
+    entity_name VARCHAR,
+    proc_type {proc_type},
+    status {status},
+    clarif_until TIMESTAMPTZ,
+    title VARCHAR,
+    uaid VARCHAR,
+    id VARCHAR,
+    price DECIMAL(12,2),
+    price_uah DECIMAL(12,2),
+    currency {currency},
+    vat BOOLEAN,
+    date DATE,
+    date_modified TIMESTAMPTZ);""",
+]
+
+# Tenders ranked per day in daily_top, stored whole so the top is read
+# without touching the tenders table
+TOP_SIZE = 100
+
+summary_update = """
+INSERT INTO daily_summary
+SELECT date, coalesce(proc_type, ''), coalesce(currency, ''),
+    count(*), coalesce(sum(price_uah), 0)
+FROM {source} WHERE date IS NOT NULL
+GROUP BY ALL
+ON CONFLICT (date, proc_type, currency) DO UPDATE SET
+    tenders = daily_summary.tenders + excluded.tenders,
+    total_uah = daily_summary.total_uah + excluded.total_uah;"""
+
+top_update = [
+    """
+CREATE OR REPLACE TEMP TABLE top_candidates AS
+SELECT * EXCLUDE (rank) FROM daily_top
+WHERE date IN (SELECT DISTINCT date FROM {source})
+UNION ALL BY NAME
+SELECT * FROM {source} WHERE date IS NOT NULL;""",
+    """
+DELETE FROM daily_top
+WHERE date IN (SELECT DISTINCT date FROM top_candidates);""",
+    f"""
+INSERT INTO daily_top
+SELECT row_number() OVER (
+        PARTITION BY date ORDER BY price_uah DESC NULLS LAST, id) AS rank,
+    *
+FROM top_candidates
+QUALIFY rank <= {TOP_SIZE};""",
+    "DROP TABLE top_candidates;",
+]
+
+# Takes the replaced versions of tenders back out of daily_summary
+summary_remove = [
+    """
+UPDATE daily_summary SET
+    tenders = daily_summary.tenders - removed.tenders,
+    total_uah = daily_summary.total_uah - removed.total_uah
+FROM (
+    SELECT date, coalesce(proc_type, '') AS proc_type,
+        coalesce(currency, '') AS currency,
+        count(*) AS tenders, coalesce(sum(price_uah), 0) AS total_uah
+    FROM {replaced} WHERE date IS NOT NULL
+    GROUP BY ALL) removed
+WHERE daily_summary.date = removed.date
+    AND daily_summary.proc_type = removed.proc_type
+    AND daily_summary.currency = removed.currency;""",
+    "DELETE FROM daily_summary WHERE tenders = 0;",
+]
+
+# A replaced tender may drop out of its day's top, so the days touched
+# by a batch with replacements are ranked again from the tenders table
+top_recompute = [
+    """
+CREATE OR REPLACE TEMP TABLE top_days AS
+SELECT date FROM {source} WHERE date IS NOT NULL
+UNION SELECT date FROM {replaced} WHERE date IS NOT NULL;""",
+    "DELETE FROM daily_top WHERE date IN (SELECT date FROM top_days);",
+    f"""
+INSERT INTO daily_top
+SELECT row_number() OVER (
+        PARTITION BY date ORDER BY price_uah DESC NULLS LAST, id) AS rank,
+    *
+FROM tenders
+WHERE date IN (SELECT date FROM top_days)
+QUALIFY rank <= {TOP_SIZE};""",
+    "DROP TABLE top_days;",
+]
+
+# One row per ID from a batch, the latest version
+incoming_create = """
+CREATE OR REPLACE TEMP TABLE incoming_tenders AS
+SELECT * FROM {source}
+QUALIFY row_number() OVER (
+    PARTITION BY id ORDER BY date_modified DESC NULLS LAST) = 1;"""
+
+# A stored tender is replaced by a version modified later, or by any
+# version if it was stored without `date_modified`
+newer_condition = ("tenders.date_modified IS NULL "
+                   "OR {new}.date_modified > tenders.date_modified")
+
+replaced_create = f"""
+CREATE OR REPLACE TEMP TABLE replaced_tenders AS
+SELECT tenders.* FROM tenders JOIN incoming_tenders USING (id)
+WHERE {newer_condition.format(new="incoming_tenders")};"""
+
+upsert_string = (
+    "INSERT INTO tenders SELECT * FROM incoming_tenders "
+    "ON CONFLICT (id) DO UPDATE SET "
+    + ", ".join(f"{f.name} = excluded.{f.name}"
+                for f in tender_schema if f.name != "id")
+    + f" WHERE {newer_condition.format(new='excluded')} RETURNING *;")
+
+index_statements = [
+    "CREATE INDEX IF NOT EXISTS idx_tenders_date ON tenders(date);",
+    "CREATE INDEX IF NOT EXISTS idx_tenders_entity ON tenders(entity_id);",
+]
+
+# DuckDB cannot change the type of a column of an indexed table
+drop_index_statements = [
+    "DROP INDEX IF EXISTS idx_tenders_date;",
+    "DROP INDEX IF EXISTS idx_tenders_entity;",
+]
+
+# Older databases index proc_type, which the ENUM filters better without.
+# It has to be dropped in a transaction of its own: DuckDB does not
+# change the type of a column in the transaction that drops its index.
+drop_legacy_index = "DROP INDEX IF EXISTS idx_tenders_proc;"
+
+
+known_query = ("SELECT id, epoch_us(date_modified) AS modified "
+               "FROM tenders WHERE date >= ?")
+
+# Copied whole into snapshots; tenders only from a recent date
+SNAPSHOT_TABLES = ("procdict", "statusdict", "daily_summary", "daily_top")
+SNAPSHOT_SUFFIX = ".snapshot.db"
+# Which collection a snapshot comes from, and whether it had finished
+snapshot_meta_create = """
+    CREATE TABLE snapshot.meta (
+        day DATE,
+        complete BOOLEAN,
+        published TIMESTAMPTZ DEFAULT current_timestamp
+    );
+"""
+
+
+def snapshot_path(database) -> Path:
+    """
+    Read-only snapshot published next to `database`
+    """
+    database = Path(database)
+    return database.with_name(database.stem + SNAPSHOT_SUFFIX)
+
+
+def read_snapshot_meta(con) -> Optional[Tuple[date, bool]]:
+    """
+    `(day, complete)` of the snapshot open in `con`; None for snapshots
+    published before the meta table existed
+    """
+    try:
+        return con.execute("SELECT day, complete FROM meta;").fetchone()
+    except duckdb.CatalogException:
+        return None
+
+
+def classifier_to_table(data, schema: pa.schema):
+    columns = list(zip(*data))
+    arrays = [pa.array(col, type=f.type) for col, f in zip(columns, schema)]
+    table = pa.Table.from_arrays(arrays, schema=schema)
+    return table
+
+
+def update_aggregates(con, source: str, replaced: Optional[str] = None):
+    """
+    Adds the tenders of the relation `source` to daily_summary and
+    daily_top, taking out the stored versions they `replaced`; only the
+    days present in `source` (and `replaced`) are touched
+    """
+    con.execute(summary_update.format(source=source))
+    if replaced is None:
+        for sql in top_update:
+            con.execute(sql.format(source=source))
+        return
+    for sql in summary_remove:
+        con.execute(sql.format(replaced=replaced))
+    for sql in top_recompute:
+        con.execute(sql.format(source=source, replaced=replaced))
+
+
+def rebuild_aggregates(con) -> int:
+    """
+    Recomputes daily_summary and daily_top from all tenders; returns the
+    number of rows that differed from the incrementally kept ones
+    """
+    before = {name: con.execute(f"SELECT * FROM {name};").fetchall()
+              for name in ("daily_summary", "daily_top")}
+    con.execute("DELETE FROM daily_summary;")
+    con.execute("DELETE FROM daily_top;")
+    update_aggregates(con, "tenders")
+    differ = 0
+    for name, rows in before.items():
+        after = con.execute(f"SELECT * FROM {name};").fetchall()
+        differ += len(set(rows) ^ set(after))
+    return differ
+
+
+def enum_sql(values: Sequence[str]) -> str:
+    quoted = ", ".join("'" + v.replace("'", "''") + "'" for v in values)
+    return f"ENUM({quoted})"
+
+
+def column_type(con, table: str, column: str,
+                database: Optional[str] = None) -> Optional[str]:
+    row = con.execute(
+        "SELECT data_type FROM duckdb_columns() "
+        "WHERE database_name = coalesce(?, current_database()) "
+        "AND schema_name = 'main' AND table_name = ? "
+        "AND column_name = ?;", [database, table, column]).fetchone()
+    return row[0] if row else None
+
+
+def enum_values(con, database: Optional[str] = None) -> Dict[str, List[str]]:
+    """
+    Values of the code columns of the tenders table in `database` (by
+    default, the current one) by ENUM type: the declared ones, or the
+    stored ones while the columns are VARCHAR
+    """
+    table = f"{database}.main.tenders" if database else "tenders"
+    enums = {}
+    for column, name in ENUM_COLUMNS["tenders"].items():
+        data_type = column_type(con, "tenders", column, database)
+        if data_type.startswith("ENUM"):
+            enums[name] = con.execute(
+                f"SELECT enum_range(NULL::{data_type});").fetchone()[0]
+        else:
+            enums[name] = [r[0] for r in con.execute(
+                f"SELECT DISTINCT {column} FROM {table} "
+                f"WHERE {column} IS NOT NULL ORDER BY 1;").fetchall()]
+    return enums
+
+
+def _alter_enums(con, enums: Dict[str, Sequence[str]], tables=ENUM_COLUMNS):
+    for sql in drop_index_statements:
+        con.execute(sql)
+    for table, columns in tables.items():
+        if column_type(con, table, next(iter(columns))) is None:
+            continue
+        for column, name in columns.items():
+            con.execute(f"ALTER TABLE {table} ALTER {column} "
+                        f"TYPE {enum_sql(enums[name])};")
+    for sql in index_statements:
+        con.execute(sql)
+
+
+def create_dictionaries(con, enums: Dict[str, Sequence[str]]):
+    """
+    (Re)creates procdict and statusdict from the classifiers, keyed by
+    the ENUM types of the tenders they are joined with
+    """
+    types = {name: enum_sql(values) for name, values in enums.items()}
+    for sql in dictionaries_create_strings:
+        con.execute(sql.format(**types))
+    con.register("procedure_table", classifier_to_table(
+        dict(PROCDICT).items(), proc_schema))
+    con.execute("INSERT INTO procdict SELECT * FROM procedure_table;")
+    con.register("status_table", classifier_to_table(
+        dict(STATUSDICT).items(), status_schema))
+    con.execute("INSERT INTO statusdict SELECT * FROM status_table;")
+    con.unregister("procedure_table")
+    con.unregister("status_table")
+
+
+def widen_enums(con, new: Dict[str, Set[str]]) -> Dict[str, List[str]]:
+    """
+    Adds the `new` values to the ENUM types (by name) of all tables;
+    returns the widened types. The columns are rewritten, which takes
+    a moment on a big table but happens only when a code is met for the
+    first time.
+    """
+    enums = enum_values(con)
+    for name, values in new.items():
+        enums[name] = enums[name] + sorted(set(values) - set(enums[name]))
+    _alter_enums(con, enums)
+    create_dictionaries(con, enums)
+    logging.info("ENUM types widened: " + ", ".join(
+        f"{name} +{len(values)}" for name, values in new.items()))
+    return enums
+
+
+def migrate(con) -> bool:
+    """
+    Converts a tenders table (and its daily_top) from the plain layout,
+    with codes and `clarif_until` stored as VARCHAR, to the typed one
+    in place; returns whether there was anything to convert
+    """
+    if not column_type(con, "tenders", "proc_type").startswith("VARCHAR"):
+        return False
+    start = time.perf_counter()
+    enums = {name: list(ENUM_SEEDS[name])
+             + sorted(set(stored) - set(ENUM_SEEDS[name]))
+             for name, stored in enum_values(con).items()}
+    tables = {t: ENUM_COLUMNS[t] for t in ("tenders", "daily_top")}
+    for sql in drop_index_statements:
+        con.execute(sql)
+    for table in tables:
+        if column_type(con, table, "clarif_until") == "VARCHAR":
+            con.execute(f"ALTER TABLE {table} ALTER clarif_until "
+                        "TYPE TIMESTAMPTZ "
+                        "USING TRY_CAST(clarif_until AS TIMESTAMPTZ);")
+    _alter_enums(con, enums, tables)
+    logging.info(f"Tenders converted to the typed layout in "
+                 f"{time.perf_counter() - start:.2f} s")
+    return True
+
+
+def create_tables(con):
+    con.sql(duckdb_create_string.format(
+        **{name: enum_sql(values) for name, values in ENUM_SEEDS.items()}))
+    con.sql(rates_create_string)
+    migrate(con)
+    enums = enum_values(con)
+    types = {name: enum_sql(values) for name, values in enums.items()}
+    new_aggregates = not con.execute(
+        "SELECT count(*) FROM duckdb_tables() "
+        "WHERE table_name = 'daily_summary';").fetchone()[0]
+    for sql in aggregates_create_strings:
+        con.sql(sql.format(**types))
+    for table in ("tenders", "daily_top"):
+        # Databases from before the modification dates were kept; their
+        # tenders are replaced by the next version the feed shows
+        if column_type(con, table, "date_modified") is None:
+            con.execute(f"ALTER TABLE {table} "
+                        "ADD COLUMN date_modified TIMESTAMPTZ;")
+    con.sql(history_create_string.format(**types))
+    if new_aggregates:
+        # Databases from before the aggregates existed
+        rebuild_aggregates(con)
+    for idx_sql in index_statements:
+        con.sql(idx_sql)
+    create_dictionaries(con, enums)
+
+
+class TenderBatchBuilder:
+    """
+    Collects parsed tenders straight into per-column buffers in
+    `tender_schema` order and builds a `pa.RecordBatch` from them, so no
+    per-row dict is allocated and the columns need no second pass.
+    `transforms` maps column names to functions applied to the whole
+    column array when the batch is built. Codes, dates and timestamps
+    are appended as strings and converted by Arrow column-wise.
+    """
+
+    def __init__(self, schema: pa.Schema = tender_schema,
+                 transforms: Optional[Dict[str, Callable]] = None):
+        self.schema = schema
+        self.raw_schema = pa.schema([
+            pa.field(f.name, pa.string())
+            if pa.types.is_dictionary(f.type) or pa.types.is_temporal(f.type)
+            else f for f in schema])
+        self.transforms = transforms or {}
+        self._reset()
+
+    def _reset(self):
+        self._columns: List[list] = [[] for _ in self.schema]
+        self._appends = [col.append for col in self._columns]
+
+    def __len__(self):
+        return len(self._columns[0])
+
+    def append(self, row: Sequence):
+        for append, value in zip(self._appends, row):
+            append(value)
+
+    def extend(self, columns: Dict[str, list]):
+        for col, field in zip(self._columns, self.schema):
+            col.extend(columns[field.name])
+
+    def to_pydict(self) -> Dict[str, list]:
+        return {field.name: list(col)
+                for field, col in zip(self.schema, self._columns)}
+
+    def raw(self, batch: pa.RecordBatch) -> Dict[str, list]:
+        """
+        Columns of a built batch as they were appended, e.g. to be
+        saved into a checkpoint
+        """
+        return batch.cast(self.raw_schema).to_pydict()
+
+    def build(self) -> pa.RecordBatch:
+        arrays = []
+        for col, field, raw in zip(self._columns, self.schema,
+                                   self.raw_schema):
+            array = pa.array(col, type=raw.type)
+            if raw.type != field.type:
+                array = array.cast(field.type)
+            if (transform := self.transforms.get(field.name)) is not None:
+                array = transform(array)
+            arrays.append(array)
+        batch = pa.RecordBatch.from_arrays(arrays, schema=self.schema)
+        self._reset()
+        return batch
+
+
+class BatchTiming(NamedTuple):
+    rows: int
+    written: int
+    seconds: float
+    replaced: int = 0
+
+
+class TenderStore:
+    """
+    Keeps one DuckDB connection open for the whole run. Batches are Arrow
+    tables or record batches scanned by DuckDB in bulk; the rows written
+    come from the upsert itself, so no table scan is needed to tell them
+    from unchanged ones. With `history`, the replaced versions of
+    tenders are kept in tender_history. With `memory_limit` (bytes),
+    DuckDB spills to its temporary directory instead of growing past it.
+    """
+
+    def __init__(self, database=DUCKDB_NAME, history: bool = False,
+                 memory_limit: Optional[int] = None):
+        self.database = database
+        self.history = history
+        self.con = duckdb.connect(database=database)
+        if memory_limit is not None:
+            limit = max(memory_limit // MIB, 4)
+            self.con.execute(f"SET memory_limit = '{limit}MiB';")
+            # Cached allocations are freed after every query past a
+            # quarter of the limit, not only past 128 MiB
+            self.con.execute(
+                f"SET allocator_flush_threshold = '{limit // 4}MiB';")
+        self.timings: List[BatchTiming] = []
+        self.enums: Dict[str, Set[str]] = {}
+        # Changing a column type conflicts with a snapshot being taken
+        self._schema_lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def create_tables(self):
+        self.con.execute(drop_legacy_index)
+        self.con.begin()
+        create_tables(self.con)
+        self.con.commit()
+        self.enums = {name: set(values)
+                      for name, values in enum_values(self.con).items()}
+
+    def _widen(self, new: Dict[str, Set[str]]):
+        new = {name: values - self.enums[name]
+               for name, values in new.items()}
+        new = {name: values for name, values in new.items() if values}
+        if not new:
+            return
+        with self._schema_lock:
+            self.con.begin()
+            try:
+                enums = widen_enums(self.con, new)
+                self.con.commit()
+            except Exception:
+                self.con.rollback()
+                raise
+        self.enums = {name: set(values) for name, values in enums.items()}
+
+    def _codes(self, data: Union[pa.Table, pa.RecordBatch]
+               ) -> Dict[str, Set[str]]:
+        return {name: set(pc.unique(data.column(column)).to_pylist())
+                - {None}
+                for column, name in ENUM_COLUMNS["tenders"].items()}
+
+    def known(self, since: date) -> Dict[str, Optional[int]]:
+        """
+        `date_modified` of the tenders dated `since` or later by ID, in
+        microseconds since the epoch (None if stored without it)
+        """
+        table = self.con.execute(
+            known_query + ";", [since]).to_arrow_table()
+        return dict(zip(table.column("id").to_pylist(),
+                        table.column("modified").to_pylist()))
+
+    def modified(self, ids: Sequence[str],
+                 since: date) -> Dict[str, Optional[int]]:
+        """
+        `known` restricted to `ids`, looked up in the database on a
+        cursor of its own, so it can run while a batch is being written
+        """
+        cur = self.con.cursor()
+        try:
+            # Joined as an Arrow table: binding a long list parameter is
+            # several times slower
+            cur.register("lookup_ids", pa.table({"id": pa.array(
+                ids, pa.string())}))
+            table = cur.execute(
+                known_query + " AND id IN (SELECT id FROM lookup_ids);",
+                [since]).to_arrow_table()
+        finally:
+            cur.close()
+        return dict(zip(table.column("id").to_pylist(),
+                        table.column("modified").to_pylist()))
+
+    def _upsert(self, source: str) -> Tuple[pa.Table, int]:
+        """
+        Writes the tenders of the relation `source` in the open
+        transaction: new IDs are inserted, stored tenders are replaced by
+        versions modified later, the rest is skipped. Returns the rows
+        written and how many of them replaced stored ones.
+        """
+        con = self.con
+        con.execute(incoming_create.format(source=source))
+        con.execute(replaced_create)
+        written = con.execute(upsert_string).to_arrow_table()
+        replaced = con.execute(
+            "SELECT count(*) FROM replaced_tenders;").fetchone()[0]
+        if written.num_rows:
+            con.register("written_tenders", written)
+            try:
+                update_aggregates(con, "written_tenders",
+                                  "replaced_tenders" if replaced else None)
+            finally:
+                con.unregister("written_tenders")
+        if replaced and self.history:
+            con.execute("INSERT INTO tender_history "
+                        "SELECT * FROM replaced_tenders;")
+        con.execute("DROP TABLE incoming_tenders;")
+        con.execute("DROP TABLE replaced_tenders;")
+        return written, replaced
+
+    def insert(self, data: Union[pa.Table, pa.RecordBatch]) -> pa.Table:
+        """
+        Upserts the rows of `data`, skipping the tenders stored with the
+        same or a later `date_modified`; returns the rows written
+        """
+        start = time.perf_counter()
+        self._widen(self._codes(data))
+        self.con.register("tenders_data", data)
+        try:
+            self.con.begin()
+            written, replaced = self._upsert("tenders_data")
+            self.con.commit()
+        except Exception:
+            self.con.rollback()
+            raise
+        finally:
+            self.con.unregister("tenders_data")
+        self.timings.append(BatchTiming(
+            data.num_rows, written.num_rows, time.perf_counter() - start,
+            replaced))
+        return written
+
+    def rebuild_aggregates(self) -> int:
+        self.con.begin()
+        try:
+            differ = rebuild_aggregates(self.con)
+            self.con.commit()
+        except Exception:
+            self.con.rollback()
+            raise
+        return differ
+
+    def merge(self, path) -> pa.Table:
+        """
+        Moves the tenders and exchange rates of another database file
+        (a backfill shard) into this one in a single transaction;
+        returns the tenders written
+        """
+        start = time.perf_counter()
+        escaped = str(path).replace("'", "''")
+        self.con.execute(f"ATTACH '{escaped}' AS shard (READ_ONLY);")
+        try:
+            self._widen({name: set(values) for name, values
+                         in enum_values(self.con, "shard").items()})
+            rows = self.con.execute(
+                "SELECT count(*) FROM shard.tenders;").fetchone()[0]
+            self.con.begin()
+            written, replaced = self._upsert("shard.tenders")
+            self.con.execute("INSERT OR REPLACE INTO exchange_rates "
+                             "SELECT * FROM shard.exchange_rates;")
+            self.con.commit()
+        except Exception:
+            self.con.rollback()
+            raise
+        finally:
+            self.con.execute("DETACH shard;")
+        self.timings.append(BatchTiming(
+            rows, written.num_rows, time.perf_counter() - start, replaced))
+        return written
+
+    def snapshot(self, since: date, path=None, day: Optional[date] = None,
+                 complete: bool = False) -> Path:
+        """
+        Publishes a consistent copy of the dictionaries, the aggregates
+        and the tenders dated `since` or later as a separate database
+        file, which readers can open while this store is being written.
+        Its `meta` table records the collected `day` and whether the
+        collection was `complete`. The new file replaces the previous
+        snapshot atomically.
+        """
+        path = Path(path or snapshot_path(self.database))
+        tmp = path.with_name(f".{path.name}.tmp")
+        tmp.unlink(missing_ok=True)
+        escaped = tmp.as_posix().replace("'", "''")
+        # Own cursor: the writer thread may be inserting meanwhile
+        cur = self.con.cursor()
+        try:
+            with self._schema_lock:
+                cur.execute(f"ATTACH '{escaped}' AS snapshot;")
+                try:
+                    cur.begin()
+                    for table in SNAPSHOT_TABLES:
+                        cur.execute(f"CREATE TABLE snapshot.{table} AS "
+                                    f"SELECT * FROM {table};")
+                    cur.execute("CREATE TABLE snapshot.tenders AS "
+                                "SELECT * FROM tenders WHERE date >= ?;",
+                                [since])
+                    cur.execute(snapshot_meta_create)
+                    cur.execute("INSERT INTO snapshot.meta (day, complete) "
+                                "VALUES (?, ?);", [day, complete])
+                    cur.commit()
+                except Exception:
+                    cur.rollback()
+                    raise
+                finally:
+                    cur.execute("DETACH snapshot;")
+        finally:
+            cur.close()
+        os.replace(tmp, path)
+        return path
+
+    def report(self):
+        if not self.timings:
+            return
+        rows = sum(t.rows for t in self.timings)
+        written = sum(t.written for t in self.timings)
+        replaced = sum(t.replaced for t in self.timings)
+        seconds = sum(t.seconds for t in self.timings)
+        logging.info(f"DuckDB writer: {len(self.timings)} batches, "
+                     f"{written - replaced} inserted, {replaced} replaced, "
+                     f"{rows - written} unchanged, "
+                     f"{seconds:.2f} s total, "
+                     f"{max(t.seconds for t in self.timings):.3f} s max "
+                     "per batch")
+
+    def close(self):
+        self.con.close()
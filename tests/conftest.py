@@ -0,0 +1,17 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+# The modules live at the top of the repository and import each other
+# by their plain names
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from store import TenderStore  # noqa: E402
+
+
+@pytest.fixture
+def store(tmp_path):
+    with TenderStore(tmp_path / "t.db") as store:
+        store.create_tables()
+        yield store
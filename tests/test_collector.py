@@ -0,0 +1,175 @@
+import json
+from datetime import date, datetime, time, timedelta, timezone
+
+import pytest
+import requests
+
+from get_procurements import Collector
+from utils import KYIV_ZONE
+
+
+DAY = date(2024, 3, 10)
+
+
+def tender(tid, tdate, modified, status="active", amount=1000.0):
+    start = datetime.combine(tdate, time(12), tzinfo=KYIV_ZONE)
+    return {
+        "id": tid,
+        "tenderID": f"UA-{tdate.isoformat()}-000001-a",
+        "dateModified": modified.isoformat(),
+        "dateCreated": start.isoformat(),
+        "procurementMethodType": "belowThreshold",
+        "status": status,
+        "title": "Title",
+        "procuringEntity": {"name": "Entity",
+                            "identifier": {"id": "12345678"}},
+        "value": {"amount": amount, "currency": "UAH",
+                  "valueAddedTaxIncluded": True},
+        "enquiryPeriod": {"startDate": start.isoformat()},
+    }
+
+
+def run_collector(store, tmp_path, docs, day=DAY):
+    collector = Collector(day, store, checkpoint_path=tmp_path / "cp.json",
+                          progress=False, publish=False)
+    index = {doc["id"]: doc for doc in docs}
+    collector.crawl_feed = lambda offset, stop_date, on_page=None: iter([
+        {"id": d["id"], "dateModified": d["dateModified"],
+         "dateCreated": d["dateCreated"], "tenderID": d["tenderID"]}
+        for d in docs])
+    collector.get_procurement = index.get
+    collector.run()
+    return collector
+
+
+def test_modified_tender_dated_before_the_day_is_updated(store, tmp_path):
+    # Collected on 2024-03-07, modified again on the collected day
+    old = tender("a" * 32, date(2024, 3, 7),
+                 datetime(2024, 3, 7, 13, tzinfo=timezone.utc))
+    run_collector(store, tmp_path, [old], day=date(2024, 3, 7))
+
+    new = tender("a" * 32, date(2024, 3, 7),
+                 datetime(2024, 3, 10, 9, tzinfo=timezone.utc),
+                 status="complete", amount=2000.0)
+    fresh = tender("b" * 32, DAY,
+                   datetime(2024, 3, 10, 13, tzinfo=timezone.utc))
+    collector = run_collector(store, tmp_path, [new, fresh])
+
+    assert collector.stats["modified"] == 1
+    rows = dict(store.con.execute(
+        "SELECT id, CAST(status AS VARCHAR) FROM tenders").fetchall())
+    assert rows == {"a" * 32: "belowThreshold.complete",
+                    "b" * 32: "belowThreshold.active"}
+    assert store.con.execute(
+        "SELECT date, price FROM tenders WHERE id = ?",
+        ["a" * 32]).fetchone() == (date(2024, 3, 7), 2000)
+    assert store.rebuild_aggregates() == 0
+
+
+def test_unmodified_stored_tender_is_not_fetched(store, tmp_path):
+    doc = tender("c" * 32, DAY, datetime(2024, 3, 10, 9, tzinfo=timezone.utc))
+    run_collector(store, tmp_path, [doc])
+    fetched = []
+    collector = Collector(DAY, store, checkpoint_path=tmp_path / "cp.json",
+                          progress=False, publish=False)
+    collector.crawl_feed = lambda offset, stop_date, on_page=None: iter(
+        [{"id": doc["id"], "dateModified": doc["dateModified"]}])
+    collector.get_procurement = lambda tid: fetched.append(tid)
+    collector.run()
+    assert fetched == [] and collector.stats["known"] == 1
+
+
+def test_only_the_final_snapshot_is_complete(store, tmp_path, monkeypatch):
+    published = []
+    monkeypatch.setattr(store, "snapshot", lambda since, path=None, day=None,
+                        complete=False: published.append((day, complete)))
+    doc = tender("d" * 32, DAY, datetime(2024, 3, 10, 9, tzinfo=timezone.utc))
+    monkeypatch.setattr("get_procurements.CHECKPOINT_EVERY", 1)
+    collector = Collector(DAY, store, checkpoint_path=tmp_path / "cp.json",
+                          progress=False)
+    collector.crawl_feed = lambda offset, stop_date, on_page=None: iter(
+        [{"id": doc["id"], "dateModified": doc["dateModified"]}])
+    collector.get_procurement = lambda tid: doc
+    collector.run()
+    assert published == [(DAY, False), (DAY, True)]
+
+
+def test_last_backfill_window_keeps_the_range_only(store, tmp_path):
+    # Dated within the range but modified later, and dated after it
+    late = tender("e" * 32, date(2024, 3, 9),
+                  datetime(2024, 3, 20, 9, tzinfo=timezone.utc))
+    after = tender("f" * 32, date(2024, 3, 15),
+                   datetime(2024, 3, 20, 10, tzinfo=timezone.utc))
+    stops = []
+    collector = Collector(DAY, store, since=date(2024, 3, 9), until=DAY,
+                          checkpoint_path=tmp_path / "cp.json",
+                          progress=False, publish=False)
+    index = {d["id"]: d for d in (late, after)}
+
+    def crawl_feed(offset, stop_date, on_page=None):
+        stops.append(stop_date)
+        return iter([{"id": d["id"], "dateModified": d["dateModified"]}
+                     for d in index.values()])
+    collector.crawl_feed = crawl_feed
+    collector.get_procurement = index.get
+    collector.run()
+
+    assert stops[0] > datetime.now(timezone.utc) - timedelta(minutes=1)
+    assert collector.stats["dated_after"] == 1
+    assert store.con.execute("SELECT id FROM tenders").fetchall() == [
+        ("e" * 32,)]
+
+
+class RecordingTransport:
+
+    def __init__(self, pages):
+        self.pages = iter(pages)
+        self.calls = []
+
+    def get(self, url, **kwargs):
+        self.calls.append((url, kwargs))
+        res = requests.Response()
+        res.status_code = 200
+        res._content = json.dumps(next(self.pages)).encode()
+        return res
+
+
+def test_certificates_are_skipped_for_the_feed_only(store, tmp_path):
+    collector = Collector(DAY, store, checkpoint_path=tmp_path / "cp.json",
+                          progress=False, publish=False)
+    assert collector.http.session.verify is True
+
+    transport = RecordingTransport([
+        {"data": [{"id": "g" * 32, "dateModified": "2024-03-10T10:00:00"
+                   "+02:00"}], "next_page": {"offset": "2"}},
+        {"data": [], "next_page": {"offset": "2"}}])
+    collector = Collector(DAY, store, http=transport,
+                          checkpoint_path=tmp_path / "cp.json",
+                          progress=False, publish=False)
+    stop = datetime(2024, 3, 11, tzinfo=KYIV_ZONE)
+    assert [item["id"] for item in collector.crawl_feed("1", stop)] == [
+        "g" * 32]
+    assert all(kwargs["verify"] is False for _, kwargs in transport.calls)
+
+
+def test_failed_run_stops_the_writer(store, tmp_path, monkeypatch):
+    monkeypatch.setattr("get_procurements.BATCH_SIZE", 1)
+    docs = [tender(c * 32, DAY, datetime(2024, 3, 10, 9 + n,
+                                         tzinfo=timezone.utc))
+            for n, c in enumerate("hij")]
+    collector = Collector(DAY, store, checkpoint_path=tmp_path / "cp.json",
+                          progress=False, publish=False)
+    collector.crawl_feed = lambda offset, stop_date, on_page=None: iter(
+        [{"id": d["id"], "dateModified": d["dateModified"]} for d in docs])
+
+    def get_procurement(tid):
+        if tid == "j" * 32:
+            raise RuntimeError("network is gone")
+        return next(d for d in docs if d["id"] == tid)
+    collector.get_procurement = get_procurement
+    with pytest.raises(RuntimeError):
+        collector.run()
+    assert not collector.writer._thread.is_alive()
+    assert (tmp_path / "cp.json").is_file()
+    # The store is free for the next run
+    run_collector(store, tmp_path, docs[:2])
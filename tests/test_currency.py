@@ -0,0 +1,136 @@
+import json
+import threading
+from datetime import date, datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+
+import currency
+from currency import ExchangeRates, fill_days
+from transport import Transport
+
+
+def nbu_date(value):
+    return datetime.strptime(value, "%Y%m%d").date()
+
+
+class StubNbu(ThreadingHTTPServer):
+    """
+    Both NBU endpoints over `rates` by `(currency, day)`; the range
+    endpoint answers 500 while `range_down` is set. `requests` counts the
+    requests per path.
+    """
+
+    def __init__(self, rates):
+        super().__init__(("127.0.0.1", 0), StubNbuHandler)
+        self.rates = rates
+        self.range_down = False
+        self.requests = {}
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        host, port = self.server_address
+        return f"http://{host}:{port}"
+
+    def answer(self, path, params):
+        with self.lock:
+            self.requests[path] = self.requests.get(path, 0) + 1
+        if path == "/range":
+            if self.range_down:
+                return 500, {"error": "unavailable"}
+            start, end = nbu_date(params["start"]), nbu_date(params["end"])
+            return 200, [
+                {"exchangedate": f"{day:%d.%m.%Y}", "rate": rate * 10,
+                 "units": 10}
+                for (code, day), rate in sorted(self.rates.items())
+                if code == params["valcode"].upper() and start <= day <= end]
+        rate = self.rates.get((params["valcode"], nbu_date(params["date"])))
+        return 200, [] if rate is None else [{"rate": rate}]
+
+
+class StubNbuHandler(BaseHTTPRequestHandler):
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        params = {k: v[0] for k, v in parse_qs(url.query).items()}
+        status, answer = self.server.answer(url.path, params)
+        body = json.dumps(answer).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+# Published on working days only: Friday 8 March, then Monday 11 March
+PUBLISHED = {
+    ("USD", date(2024, 3, 7)): 38.1,
+    ("USD", date(2024, 3, 8)): 38.2,
+    ("USD", date(2024, 3, 11)): 38.5,
+    ("USD", date(2024, 3, 12)): 38.6,
+}
+
+
+@pytest.fixture
+def nbu(monkeypatch):
+    server = StubNbu(dict(PUBLISHED))
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,),
+                              daemon=True)
+    thread.start()
+    monkeypatch.setattr(currency, "NBU_URL", server.url + "/day")
+    monkeypatch.setattr(currency, "NBU_RANGE_URL", server.url + "/range")
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def rates(nbu):
+    return ExchangeRates(http=Transport())
+
+
+def test_tenders_take_the_rate_of_the_day_before(rates):
+    assert rates.rate("USD", date(2024, 3, 12)) == 38.5
+    assert rates.rate("USD", date(2024, 3, 13)) == 38.6
+    assert rates.rate("UAH", date(2024, 3, 13)) == 1
+
+
+def test_weekend_keeps_the_friday_rate(rates, nbu):
+    rates.prefetch(["USD"], date(2024, 3, 9), date(2024, 3, 13))
+    stored = dict(rates.con.execute(
+        "SELECT date, rate FROM exchange_rates WHERE currency = 'USD' "
+        "AND date BETWEEN '2024-03-08' AND '2024-03-11';").fetchall())
+    assert stored == {date(2024, 3, 8): 38.2, date(2024, 3, 9): 38.2,
+                      date(2024, 3, 10): 38.2, date(2024, 3, 11): 38.5}
+    # Tenders of Sunday and Monday are priced with Saturday's and
+    # Sunday's filled rate, without another request
+    assert rates.rate("USD", date(2024, 3, 10)) == 38.2
+    assert rates.rate("USD", date(2024, 3, 11)) == 38.2
+    assert nbu.requests == {"/range": 1}
+
+
+def test_fill_days():
+    assert fill_days({date(2024, 3, 8): 1.0, date(2024, 3, 11): 2.0}) == [
+        (date(2024, 3, 8), 1.0), (date(2024, 3, 9), 1.0),
+        (date(2024, 3, 10), 1.0), (date(2024, 3, 11), 2.0)]
+    assert fill_days({}) == []
+
+
+def test_per_day_requests_when_the_range_request_fails(rates, nbu):
+    nbu.range_down = True
+    assert rates.rate("USD", date(2024, 3, 12)) == 38.5
+    # The rate day and the LOOKBACK days before it, one by one
+    assert nbu.requests["/day"] == currency.LOOKBACK.days + 1
+    assert rates.rate("USD", date(2024, 3, 10)) == 38.2
+
+
+def test_no_rate_is_none(rates, nbu):
+    nbu.range_down = True
+    nbu.rates.clear()
+    assert rates.rate("USD", date(2024, 3, 12)) is None
+    assert rates.rate("USD", date(2024, 3, 12) - timedelta(days=30)) is None
@@ -0,0 +1,93 @@
+import random
+import time
+from datetime import date, datetime, timedelta, timezone
+
+import pytest
+
+from get_procurements import TenderDateResolver
+from utils import KYIV_ZONE
+
+
+# The original date logic of the collector, kept as the reference the
+# resolver is checked against
+def get_tender_date(data: dict) -> datetime:
+    # Let tdate_ be a date in future
+    tdate_ = datetime(year=2199, month=1, day=1).astimezone()
+    if (m := data.get('enquiryPeriod')) is not None:
+        tdate_ = datetime.fromisoformat(m['startDate'])
+    elif (m := data.get('data')) is not None:
+        tdate_ = datetime.fromisoformat(m['date'])
+    elif (m := data.get('tenderID')) is not None:
+        tender_date_from_id = m[3:13]
+        tdate_ = datetime.fromisoformat(
+            tender_date_from_id).astimezone(KYIV_ZONE)
+    elif (docs := data.get("documents")) is not None:
+        for doc in docs:
+            dt_published = doc["datePublished"]
+            dt_modified = doc["dateModified"]
+            docs_none_list = [x is None for x in (dt_published, dt_modified)]
+            if all(docs_none_list):
+                continue
+            dates_compare = (
+                tdate_,
+                *(datetime.fromisoformat(d).astimezone(KYIV_ZONE) for d in (
+                        dt_published,
+                        dt_modified)),)
+            tdate_ = min(dates_compare)
+    return tdate_
+
+
+SINCE = datetime.combine(date(2024, 3, 10), datetime.min.time(),
+                         tzinfo=timezone.utc).astimezone(KYIV_ZONE)
+
+
+@pytest.fixture(params=["Pacific/Auckland", "America/Los_Angeles"])
+def local_zone(request, monkeypatch):
+    # Dates taken from tenderID are naive and read in local time
+    monkeypatch.setenv("TZ", request.param)
+    time.tzset()
+    yield request.param
+    monkeypatch.undo()
+    time.tzset()
+
+
+def timestamp(rnd):
+    offset = timezone(timedelta(hours=rnd.choice([0, 2, 3, -5, 13])))
+    return (datetime(2024, 3, 8, tzinfo=offset)
+            + timedelta(seconds=rnd.randint(0, 4 * 86400))).isoformat()
+
+
+def tender(rnd, branch):
+    if branch == "enquiryPeriod":
+        return {"enquiryPeriod": {"startDate": timestamp(rnd)},
+                "tenderID": "UA-2020-01-01-000001-a"}
+    if branch == "data":
+        return {"data": {"date": timestamp(rnd)}}
+    if branch == "tenderID":
+        day = date(2024, 3, 8) + timedelta(days=rnd.randint(0, 4))
+        return {"tenderID": f"UA-{day.isoformat()}-000001-a",
+                "documents": [{"datePublished": timestamp(rnd),
+                               "dateModified": timestamp(rnd)}]}
+    if branch == "documents":
+        docs = []
+        for _ in range(rnd.randint(0, 4)):
+            published = rnd.choice([None, timestamp(rnd)])
+            modified = None if published is None else timestamp(rnd)
+            docs.append({"datePublished": published,
+                         "dateModified": modified})
+        return {"documents": docs}
+    return {}
+
+
+@pytest.mark.parametrize("branch", [
+    "enquiryPeriod", "data", "tenderID", "documents", "none"])
+def test_resolver_matches_get_tender_date(local_zone, branch):
+    rnd = random.Random(branch)
+    resolver = TenderDateResolver(SINCE)
+    for _ in range(500):
+        data = tender(rnd, branch)
+        tdate = get_tender_date(data)
+        expected = tdate.date().isoformat()
+        assert resolver.resolve(data, cutoff=False) == expected
+        assert resolver.resolve(data) == (
+            expected if tdate >= SINCE else None)
@@ -0,0 +1,165 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import fetcher
+from fetcher import (
+    AdaptiveRateLimiter, BatchWriter, RetriesExhausted, RetryBudget,
+    TokenBucket, fetch_concurrently, get_with_retries)
+from transport import Transport
+
+
+class StubServer(ThreadingHTTPServer):
+    """
+    Answers every path with the statuses scripted for it in `script`,
+    then with 200; `requests` counts the requests per path
+    """
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), StubHandler)
+        self.script = {}
+        self.requests = {}
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        host, port = self.server_address
+        return f"http://{host}:{port}"
+
+    def answer(self, path):
+        with self.lock:
+            self.requests[path] = self.requests.get(path, 0) + 1
+            script = self.script.get(path)
+            return script.pop(0) if script else (200, {})
+
+
+class StubHandler(BaseHTTPRequestHandler):
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        status, headers = self.server.answer(self.path)
+        body = b'{"data": {}}'
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class FakeClock:
+    """
+    Stands for the `time` module in fetcher: sleeping moves the clock
+    at once
+    """
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def server():
+    server = StubServer()
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,),
+                              daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(fetcher, "time", clock)
+    return clock
+
+
+def test_429_waits_for_retry_after(server, clock):
+    server.script["/t"] = [(429, {"Retry-After": "7"})]
+    limiter = AdaptiveRateLimiter(4.0, 0.5, 20.0)
+    budget = RetryBudget(5)
+    res = get_with_retries(Transport(), server.url + "/t", limiter, budget)
+    assert res.status_code == 200
+    assert server.requests["/t"] == 2
+    assert 7 in clock.sleeps
+    assert budget.used == 1
+    assert limiter.rate < 4.0
+
+
+def test_503_is_retried_with_backoff(server, clock):
+    server.script["/t"] = [(503, {}), (503, {}), (502, {})]
+    budget = RetryBudget(5)
+    res = get_with_retries(Transport(), server.url + "/t",
+                           TokenBucket(1000.0), budget)
+    assert res.status_code == 200
+    assert server.requests["/t"] == 4
+    assert budget.used == 3
+    assert len(clock.sleeps) == 3
+    assert all(0 <= s <= fetcher.BACKOFF_BASE * 2 ** n
+               for n, s in enumerate(clock.sleeps, 1))
+
+
+def test_other_errors_are_returned(server, clock):
+    server.script["/t"] = [(404, {})]
+    res = get_with_retries(Transport(), server.url + "/t",
+                           TokenBucket(1000.0), RetryBudget(5))
+    assert res.status_code == 404
+    assert server.requests["/t"] == 1
+
+
+def test_spent_budget_raises(server, clock):
+    server.script["/t"] = [(503, {})] * 10
+    budget = RetryBudget(2)
+    with pytest.raises(RetriesExhausted):
+        get_with_retries(Transport(), server.url + "/t",
+                         TokenBucket(1000.0), budget)
+    assert server.requests["/t"] == 3
+    assert budget.remaining == 0
+
+
+def test_fetch_concurrently_yields_every_id():
+    ids = (f"id{n}" for n in range(100))
+    results = dict(fetch_concurrently(str.upper, ids, workers=4))
+    assert results == {f"id{n}": f"ID{n}" for n in range(100)}
+
+
+def test_abort_drops_queued_batches():
+    started, release = threading.Event(), threading.Event()
+    written = []
+
+    def write(batch):
+        started.set()
+        release.wait()
+        written.append(batch)
+        return 1
+    writer = BatchWriter(write, maxsize=4)
+    for batch in range(4):
+        writer.put(batch)
+    started.wait()
+    threading.Timer(0.05, release.set).start()
+    writer.abort()
+    # The batch being written is finished, the queued ones are dropped
+    assert written == [0]
+    assert writer.batches == 1
+    assert not writer._thread.is_alive()
+
+
+def test_abort_swallows_the_write_error():
+    def write(batch):
+        raise ValueError("broken")
+    writer = BatchWriter(write)
+    writer.put(1)
+    writer.abort()
+    assert not writer._thread.is_alive()
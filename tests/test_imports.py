@@ -0,0 +1,68 @@
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+
+REPO = Path(__file__).resolve().parent.parent
+
+# Run in a fresh interpreter: records writes, opens under the working
+# directory, network calls and DuckDB connections made by the import.
+# Third-party packages are imported first: urllib3 probes IPv6 support
+# with a loopback socket when it loads.
+PROBE = """
+import importlib, json, os, sys
+import duckdb
+
+for name in ("pyarrow", "pyarrow.compute", "requests", "telebot", "tqdm",
+             "msgspec"):
+    try:
+        importlib.import_module(name)
+    except ImportError:
+        pass
+
+touched = []
+cwd = os.getcwd()
+WRITE = os.O_WRONLY | os.O_RDWR | os.O_CREAT | os.O_APPEND | os.O_TRUNC
+
+
+def hook(event, args):
+    if event == "open":
+        path, mode, flags = args
+        path = os.path.abspath(os.fsdecode(path)) \\
+            if isinstance(path, (str, bytes)) else str(path)
+        writes = any(c in mode for c in "wax+") if mode else flags & WRITE
+        if writes or path.startswith(cwd + os.sep):
+            touched.append(["open", path, mode])
+    elif event.startswith("socket.") and event != "socket.__new__":
+        touched.append([event, repr(args)])
+    elif event == "sqlite3.connect":
+        touched.append([event, repr(args)])
+
+
+def connect(*args, **kwargs):
+    touched.append(["duckdb.connect", repr(args)])
+    raise RuntimeError("no database at import time")
+
+
+duckdb.connect = connect
+sys.addaudithook(hook)
+sys.path.insert(0, sys.argv[2])
+__import__(sys.argv[1])
+print(json.dumps(touched))
+"""
+
+
+@pytest.mark.parametrize("module", ["currency", "bot", "get_procurements"])
+def test_import_has_no_side_effects(module, tmp_path):
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE="1")
+    result = subprocess.run(
+        [sys.executable, "-c", PROBE, module, str(REPO)],
+        cwd=tmp_path, env=env, capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
+    assert json.loads(result.stdout.splitlines()[-1]) == []
+    # Nothing created behind the audit hooks, e.g. by C extensions
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,58 @@
+from datetime import datetime, timezone
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from lake import ParquetLake
+from store import TenderBatchBuilder
+
+# Layout of the parts written before the codes became dictionaries and
+# the modification dates were kept
+OLD_SCHEMA = pa.schema([
+    ("entity_id", pa.string()),
+    ("entity_name", pa.string()),
+    ("proc_type", pa.string()),
+    ("status", pa.string()),
+    ("clarif_until", pa.string()),
+    ("title", pa.string()),
+    ("uaid", pa.string()),
+    ("id", pa.string()),
+    ("price", pa.float64()),
+    ("price_uah", pa.float64()),
+    ("currency", pa.string()),
+    ("vat", pa.bool_()),
+])
+
+
+def test_compact_conforms_old_parts(tmp_path):
+    lake = ParquetLake(tmp_path)
+    old = pa.Table.from_pylist([{
+        "entity_id": "12345678", "entity_name": "Old", "proc_type":
+        "reporting", "status": "reporting.complete",
+        "clarif_until": "2024-03-20T10:00:00+02:00", "title": "Old",
+        "uaid": "UA-2024-03-09-000001-a", "id": "a" * 32, "price": 1.0,
+        "price_uah": 1.0, "currency": "UAH", "vat": True}],
+        schema=OLD_SCHEMA)
+    lake.partition("2024-03-09").mkdir(parents=True)
+    pq.write_table(old, lake.partition("2024-03-09") / "part-old.parquet")
+
+    builder = TenderBatchBuilder()
+    builder.append(("87654321", "New", "belowThreshold",
+                    "belowThreshold.active", None, "New",
+                    "UA-2024-03-09-000002-a", "b" * 32, 2.0, 80.0, "USD",
+                    False, "2024-03-09", "2024-03-10T09:00:00+00:00"))
+    lake.append(pa.Table.from_batches([builder.build()]))
+    lake.compact()
+
+    parts = lake.parts("2024-03-09")
+    assert len(parts) == 1
+    table = pq.read_table(parts[0], partitioning=None)
+    assert table.schema.field("proc_type").type == pa.dictionary(
+        pa.int32(), pa.string())
+    rows = {r["id"]: r for r in table.to_pylist()}
+    assert rows["a" * 32]["date_modified"] is None
+    assert rows["a" * 32]["clarif_until"] == datetime(
+        2024, 3, 20, 8, tzinfo=timezone.utc)
+    assert rows["a" * 32]["proc_type"] == "reporting"
+    assert rows["b" * 32]["date_modified"] == datetime(
+        2024, 3, 10, 9, tzinfo=timezone.utc)
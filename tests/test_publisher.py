@@ -0,0 +1,160 @@
+import asyncio
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+import pytest
+import telebot
+from telebot.apihelper import ApiTelegramException
+
+import publisher
+from publisher import MESSAGE_LIMIT, fan_out, pack, telegram_length
+
+
+class FakeBotApi(ThreadingHTTPServer):
+    """
+    sendMessage of the Bot API: delivered texts go to `sent`; the calls
+    numbered in `limited` answer 429, those in `failing` 400. Texts over
+    the limit are refused as Telegram does.
+    """
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), FakeBotHandler)
+        self.calls = 0
+        self.sent = []
+        self.limited = {}
+        self.failing = set()
+        self.lock = threading.Lock()
+
+    def answer(self, params):
+        with self.lock:
+            self.calls += 1
+            n = self.calls
+        if n in self.limited:
+            return 429, {"ok": False, "error_code": 429,
+                         "description": "Too Many Requests",
+                         "parameters": {"retry_after": self.limited[n]}}
+        if n in self.failing:
+            return 400, {"ok": False, "error_code": 400,
+                         "description": "Bad Request"}
+        if telegram_length(params["text"]) > MESSAGE_LIMIT:
+            return 400, {"ok": False, "error_code": 400,
+                         "description": "Bad Request: message is too long"}
+        self.sent.append((params["chat_id"], params["text"]))
+        return 200, {"ok": True, "result": {
+            "message_id": n, "date": 0,
+            "chat": {"id": int(params["chat_id"]), "type": "channel"}}}
+
+
+class FakeBotHandler(BaseHTTPRequestHandler):
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        query = self.path.partition("?")[2]
+        params = {k: v[0] for k, v in parse_qs(body.decode()).items()}
+        params.update({k: v[0] for k, v in parse_qs(query).items()})
+        code, answer = self.server.answer(params)
+        data = json.dumps(answer).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    do_GET = do_POST
+
+
+@pytest.fixture
+def api(monkeypatch):
+    server = FakeBotApi()
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,),
+                              daemon=True)
+    thread.start()
+    host, port = server.server_address
+    monkeypatch.setattr(telebot.apihelper, "API_URL",
+                        f"http://{host}:{port}/bot{{0}}/{{1}}")
+    monkeypatch.setattr(publisher, "SEND_INTERVAL", 0)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    # Waits asked for by the publisher, returned at once
+    waited = []
+    sleep = asyncio.sleep
+
+    async def fake_sleep(delay, *args):
+        waited.append(delay)
+        await sleep(0)
+    monkeypatch.setattr(publisher.asyncio, "sleep", fake_sleep)
+    return waited
+
+
+@pytest.fixture
+def bot():
+    return telebot.TeleBot("123:TEST", threaded=False)
+
+
+def pieces(n):
+    # Astral emoji count twice in UTF-16, entities once after parsing
+    return [f"\U0001F4B0 <b>{i}</b> &amp; тендер \U0001F3DB{'x' * 300}"
+            for i in range(n)]
+
+
+def test_pack_fits_the_utf16_limit():
+    items = pieces(60)
+    messages = pack(items, suffix="\n\n<a href='x'>\U0001F4E6 Архів</a>")
+    assert len(messages) > 1
+    assert all(telegram_length(m) <= MESSAGE_LIMIT for m in messages)
+    assert "\n\n".join(messages).startswith("\n\n".join(items))
+
+
+def test_pack_counts_utf16_code_units():
+    # 3002 code points, but 6002 UTF-16 code units
+    piece = "\U0001F4B0" * 1500
+    assert pack([piece, piece]) == [piece, piece]
+    assert pack([piece, piece], limit=6002) == [piece + "\n\n" + piece]
+
+
+def test_pack_sends_the_suffix_alone_when_it_does_not_fit():
+    piece = "\U0001F4B0" * (MESSAGE_LIMIT // 2)
+    assert pack([piece], suffix="\n\nmore") == [piece, "more"]
+
+
+def test_packed_messages_are_accepted(api, bot, sleeps, tmp_path):
+    messages = pack(pieces(60))
+    sent = fan_out(bot, [(1, "day/top", messages)],
+                   state_path=tmp_path / "state.json")
+    assert sent == len(messages)
+    assert [text for _, text in api.sent] == messages
+
+
+def test_failed_publication_resumes(api, bot, sleeps, tmp_path):
+    state = tmp_path / "state.json"
+    messages = [f"message {i}" for i in range(5)]
+    api.failing = {3}
+    with pytest.raises(ApiTelegramException):
+        fan_out(bot, [(1, "day/top", messages)], state_path=state)
+    assert json.loads(state.read_text()) == {"1": {"day/top": 2}}
+
+    assert fan_out(bot, [(1, "day/top", messages)], state_path=state) == 3
+    assert [text for _, text in api.sent] == messages
+    # Delivered publications are not posted again
+    assert fan_out(bot, [(1, "day/top", messages)], state_path=state) == 0
+    assert len(api.sent) == len(messages)
+
+
+def test_flood_control_is_waited_out(api, bot, sleeps, tmp_path):
+    api.limited = {2: 7}
+    messages = ["first", "second", "third"]
+    assert fan_out(bot, [(1, "day/top", messages)],
+                   state_path=tmp_path / "state.json") == 3
+    assert 7 in sleeps
+    assert api.calls == 4
+    assert [text for _, text in api.sent] == messages
@@ -0,0 +1,49 @@
+import json
+from datetime import date
+
+import requests
+
+from get_procurements import Collector
+from recorder import Recorder, Replay
+from store import TenderStore
+
+
+class Responses:
+
+    def __init__(self, *bodies):
+        self.bodies = iter(bodies)
+
+    def get(self, url, **kwargs):
+        res = requests.Response()
+        res.status_code = 200
+        res._content = json.dumps(next(self.bodies)).encode()
+        return res
+
+
+def test_replay_reads_back_the_recorded_tenders(tmp_path):
+    recorder = Recorder("2024-03-10", root=tmp_path)
+    recorder.feed_page("1", {"data": [{"id": "a"}]})
+    recorder.tender({"id": "a", "status": "active"})
+    # Written by recorders that did not skip empty responses
+    recorder.tender(None)
+    recorder.tender({"id": "b", "status": "complete"})
+    recorder.close()
+
+    replay = Replay(tmp_path / "2024-03-10")
+    assert replay.day == "2024-03-10"
+    assert [tid for tid, _ in replay.tenders()] == ["a", "b"]
+
+
+def test_responses_without_data_are_not_recorded(tmp_path):
+    recorder = Recorder("2024-03-10", root=tmp_path / "records")
+    with TenderStore(tmp_path / "t.db") as store:
+        collector = Collector(date(2024, 3, 10), store, recorder=recorder,
+                              http=Responses({"errors": []},
+                                             {"data": {"id": "b" * 32}}),
+                              checkpoint_path=tmp_path / "cp.json",
+                              progress=False, publish=False)
+        assert collector.get_procurement("a" * 32) is None
+        assert collector.get_procurement("b" * 32) == {"id": "b" * 32}
+    recorder.close()
+    assert [tid for tid, _ in Replay(recorder.directory).tenders()] == [
+        "b" * 32]
@@ -0,0 +1,38 @@
+from datetime import date
+
+import duckdb
+import pytest
+
+from bot import snapshot_ready
+from store import read_snapshot_meta, snapshot_path
+
+
+DAY = date(2024, 3, 10)
+
+
+def test_meta_records_the_day_and_completeness(store):
+    path = store.snapshot(DAY, day=DAY)
+    assert path == snapshot_path(store.database)
+    with duckdb.connect(str(path), read_only=True) as con:
+        assert read_snapshot_meta(con) == (DAY, False)
+    store.snapshot(DAY, day=DAY, complete=True)
+    with duckdb.connect(str(path), read_only=True) as con:
+        assert read_snapshot_meta(con) == (DAY, True)
+
+
+@pytest.mark.parametrize("collected, complete, ready", [
+    (DAY, False, False),
+    (DAY, True, True),
+    (date(2024, 3, 9), True, False),
+    (date(2024, 3, 11), False, True),
+])
+def test_bot_refuses_an_unfinished_day(store, collected, complete, ready):
+    path = store.snapshot(DAY, day=collected, complete=complete)
+    assert snapshot_ready(path, DAY.isoformat()) is ready
+
+
+def test_bot_refuses_a_snapshot_without_meta(tmp_path):
+    path = tmp_path / "old.snapshot.db"
+    with duckdb.connect(str(path)) as con:
+        con.execute("CREATE TABLE daily_top (date DATE);")
+    assert not snapshot_ready(path, DAY.isoformat())
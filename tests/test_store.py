@@ -0,0 +1,76 @@
+from datetime import date, datetime, timezone
+
+import duckdb
+
+from store import TenderStore, column_type
+
+
+# The layout databases were created with before the typed columns
+BASELINE = [
+    """CREATE TABLE tenders (
+        entity_id VARCHAR,
+        entity_name VARCHAR,
+        proc_type VARCHAR,
+        status VARCHAR,
+        clarif_until VARCHAR,
+        title VARCHAR,
+        uaid VARCHAR,
+        id VARCHAR PRIMARY KEY,
+        price DECIMAL(12,2),
+        price_uah DECIMAL(12,2),
+        currency VARCHAR,
+        vat BOOLEAN,
+        date DATE);""",
+    "CREATE INDEX idx_tenders_date ON tenders(date);",
+    "CREATE INDEX idx_tenders_entity ON tenders(entity_id);",
+    "CREATE INDEX idx_tenders_proc ON tenders(proc_type);",
+]
+ROWS = [
+    ("12345678", "Entity", "belowThreshold", "belowThreshold.active",
+     "2024-03-20T10:00:00+02:00", "Title", "UA-2024-03-10-000001-a",
+     "a" * 32, 100.5, 100.5, "UAH", True, date(2024, 3, 10)),
+    # Codes the classifiers do not know, no clarifications date
+    ("87654321", "Other", "brandNewProcedure", "brandNew.status", None,
+     "Other", "UA-2024-03-10-000002-a", "b" * 32, 10.0, 400.0, "XTS",
+     False, date(2024, 3, 10)),
+]
+
+
+def test_baseline_database_is_migrated(tmp_path):
+    database = tmp_path / "old.db"
+    with duckdb.connect(str(database)) as con:
+        for sql in BASELINE:
+            con.execute(sql)
+        con.executemany("INSERT INTO tenders VALUES "
+                        "(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?);", ROWS)
+
+    for _ in range(2):
+        with TenderStore(database) as store:
+            store.create_tables()
+            con = store.con
+            for column in ("proc_type", "status", "currency"):
+                assert column_type(con, "tenders", column).startswith("ENUM")
+            assert column_type(con, "tenders", "clarif_until") == \
+                "TIMESTAMP WITH TIME ZONE"
+            assert column_type(con, "tenders", "date_modified") == \
+                "TIMESTAMP WITH TIME ZONE"
+            rows = con.execute(
+                "SELECT id, CAST(proc_type AS VARCHAR), "
+                "CAST(status AS VARCHAR), clarif_until, price_uah, "
+                "CAST(currency AS VARCHAR) FROM tenders ORDER BY id;"
+            ).fetchall()
+            assert rows == [
+                ("a" * 32, "belowThreshold", "belowThreshold.active",
+                 datetime(2024, 3, 20, 8, tzinfo=timezone.utc), 100.5, "UAH"),
+                ("b" * 32, "brandNewProcedure", "brandNew.status", None,
+                 400.0, "XTS")]
+            names = dict(con.execute(
+                "SELECT id, procdict.procedure_name FROM tenders "
+                "LEFT JOIN procdict ON tenders.proc_type = procdict.procedure "
+                "ORDER BY id;").fetchall())
+            assert names["a" * 32]
+            assert names["b" * 32] is None
+            indexes = {r[0] for r in con.execute(
+                "SELECT index_name FROM duckdb_indexes() "
+                "WHERE table_name = 'tenders';").fetchall()}
+            assert indexes == {"idx_tenders_date", "idx_tenders_entity"}
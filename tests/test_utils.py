@@ -0,0 +1,44 @@
+import itertools
+import random
+
+import pytest
+
+from utils import text_clean, text_clean_batch
+
+
+# Whitespace that Python's \s matches and RE2's \s does not
+UNICODE_SPACES = ("\x1c\x1d\x1e\x1f\x85\xa0\u1680"
+                  "\u2000\u2001\u2002\u2003\u2004\u2005\u2006\u2007"
+                  "\u2008\u2009\u200a\u2028\u2029\u202f\u205f\u3000")
+
+SAMPLES = [
+    "",
+    "   ",
+    "Закупівля \"товарів\"&nbsp;для  потреб\xa0№1",
+    "&nbsp&nbsp;&nbsp;;&amp;nbsp",
+    "`Дніпро`  'ТОВ' \"Ромашка\"",
+    "\t\n\r\x0b\x0c  title  \u3000",
+    "a" + UNICODE_SPACES + "b",
+    "\u200bzero width is not a space\u200b",
+    "Copy 'Book' KOPEKA",
+    "Сорy \u2018Вооk\u2019 КОРЕКА",
+]
+ALPHABET = (list("aeiopcxBKMHTyAEIOPCXаеіорсхВКМНТуАЕІОРСХ zZ\"`'&nbsp;\t\n")
+            + list(UNICODE_SPACES) + ["&nbsp;", "&nbsp", "\u200b"])
+
+
+def random_strings(n=2000, seed=0):
+    rnd = random.Random(seed)
+    return ["".join(rnd.choice(ALPHABET) for _ in range(rnd.randint(0, 40)))
+            for _ in range(n)]
+
+
+@pytest.mark.parametrize("typostrofe, translit, uk2en",
+                         list(itertools.product([False, True], repeat=3)))
+def test_batch_matches_scalar(typostrofe, translit, uk2en):
+    options = dict(typostrofe=typostrofe, translit=translit, uk2en=uk2en)
+    strings = SAMPLES + random_strings() + [None]
+    got = text_clean_batch(strings, **options).to_pylist()
+    expected = [None if s is None else text_clean(s, **options)
+                for s in strings]
+    assert got == expected
@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.request import ACCEPT_ENCODING
+
+
+USER_AGENT = ("Mozilla/5.0 (X11; Linux x86_64; rv:47.0) "
+              "Gecko/20100101 Firefox/47.0")
+# urllib3 decodes these; "br" is offered only if brotli is installed
+JSON_HEADERS = {
+    "User-Agent": USER_AGENT,
+    "Accept": "application/json",
+    "Accept-Encoding": ACCEPT_ENCODING}
+
+
+class Transport:
+    """
+    HTTP session shared by all requests to one service: JSON content
+    negotiation, compressed responses, a keep-alive pool of `pool_size`
+    connections per host (callers wait for a free connection instead of
+    opening extra ones) and counters of bytes received on the wire and
+    after decoding.
+    """
+
+    def __init__(self, pool_size: int = 10, verify: bool = True,
+                 headers: dict = JSON_HEADERS):
+        self.session = requests.Session()
+        self.session.headers.update(headers)
+        self.session.verify = verify
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size,
+                              pool_block=True)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.hooks["response"].append(self._count)
+        self.responses = 0
+        self.wire_bytes = 0
+        self.decoded_bytes = 0
+        self._lock = threading.Lock()
+
+    def _count(self, res: requests.Response, *args, **kwargs):
+        decoded = len(res.content)
+        wire = res.raw.tell() if res.raw is not None else decoded
+        with self._lock:
+            self.responses += 1
+            self.wire_bytes += wire
+            self.decoded_bytes += decoded
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.session.get(url, **kwargs)
+
+    def report(self) -> str:
+        ratio = self.decoded_bytes / self.wire_bytes if self.wire_bytes else 0
+        return (f"{self.responses} responses, "
+                f"{self.wire_bytes / 2 ** 20:.1f} MiB on the wire, "
+                f"{self.decoded_bytes / 2 ** 20:.1f} MiB decoded "
+                f"(x{ratio:.1f})")
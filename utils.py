@@ -2,12 +2,9 @@
 # -*- coding: utf-8 -*-
 
 
-import csv
 import re
-import zipfile
 import locale
-from typing import List, Optional, Any, Tuple
-from pathlib import Path
+from typing import Optional, Any, Tuple
 from zoneinfo import ZoneInfo
 from datetime import (
     date,
@@ -27,6 +24,10 @@ KYIV_ZONE = ZoneInfo("Europe/Kyiv")
 YESTERDAY = TODAY - timedelta(days=1)
 START_DATE = YESTERDAY.isoformat()
 DUCKDB_NAME = "procurements2.db"
+LAKE_DIR = "lake"
+RECORD_DIR = "records"
+STAGING_DIR = "staging"
+ARCHIVE_DIR = "archive"
 LIMIT = 6
 
 @dataclass
@@ -35,7 +36,7 @@ class Tender:
     entity_name: Optional[str] = None
     proc_type: Optional[str] = None
     status: Optional[str] = None
-    clarif_until: Optional[str] = None
+    clarif_until: Optional[datetime] = None
     title: Optional[str] = None
     uaid: Optional[str] = None
     id: Optional[str] = None
@@ -78,32 +79,6 @@ def beautify_number(n, suffix='грн.'):
     return f"{n} квдрлн {suffix}"
 
 
-def make_csv_datafile(data: List, filedate: str):
-    backup_dir = Path.cwd().joinpath('archive')
-    Path(backup_dir).mkdir(parents=True, exist_ok=True)
-    if not data:
-        return 1
-    header = ['entity_id', 'entity_name', 'proc_type', 'status', 
-              'clarif_until', 'title', 'uaid', 'id', 'price',
-              'price_uah', 'currency', 'vat', 'date', 'procedure_name',
-              'status_name']
-    csv_file_name = f"{filedate.replace('-', '')}_data.csv"
-    zip_file_name = Path.cwd().joinpath('archive', f"{csv_file_name}.zip")
-    with open(csv_file_name, "w") as f:
-        writer = csv.writer(f, delimiter='\t', quoting=2)
-        writer.writerow(header)
-        writer.writerows(data)
-    try:
-        with zipfile.ZipFile(
-            zip_file_name, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-            zip_file.write(csv_file_name)
-    except Exception as e:
-        pass
-    else:
-        Path(csv_file_name).unlink()
-    return 0
-
-
 def seconds_to_hms(seconds):
     hours = int(seconds // 3600)
     minutes = int((seconds % 3600) // 60)
@@ -111,22 +86,55 @@ def seconds_to_hms(seconds):
     return hours, minutes, remaining_seconds
 
 
+_EN_LETTERS = "aeiopcxBKMHTyAEIOPCX"
+_UK_LETTERS = "аеіорсхВКМНТуАЕІОРСХ"
+_TO_UK = str.maketrans(_EN_LETTERS, _UK_LETTERS)
+_TO_EN = str.maketrans(_UK_LETTERS, _EN_LETTERS)
+_REPLACEMENTS = (('\xa0', ' '), ('"', '”'), ('`', "'"))
+_NBSP_RE = re.compile("&nbsp;?")
+_SPACES_RE = re.compile(r"\s+")
+# Python's \s spelled out for RE2 (pyarrow), whose \s is ASCII-only
+_SPACES_RE2 = ("[\t-\r\x1c-\x20\x85\xa0\u1680\u2000-\u200a"
+               "\u2028\u2029\u202f\u205f\u3000]+")
+
+
 def text_clean(string: str, typostrofe=False, translit=False,
                    uk2en=False) -> Optional[str]:
-    en_letters = "aeiopcxBKMHTyAEIOPCX"
-    uk_letters = "аеіорсхВКМНТуАЕІОРСХ"
-    if not uk2en:
-        order = en_letters, uk_letters
-    else:
-        order = uk_letters, en_letters
-    transpose = str.maketrans(*order)
     k = string.replace('\xa0', ' ') \
         .replace('"', '”') \
         .replace('`', "'")
     if typostrofe:
         k = k.replace("'", '’')
-    k = re.sub("&nbsp;?", "", k)
-    k = re.sub(r"\s+", " ", k)
+    k = _NBSP_RE.sub("", k)
+    k = _SPACES_RE.sub(" ", k)
     if translit:
-        k = k.translate(transpose)
+        k = k.translate(_TO_EN if uk2en else _TO_UK)
     return k.strip()
+
+
+def text_clean_batch(strings, typostrofe=False, translit=False,
+                     uk2en=False):
+    """
+    `text_clean` over a whole column at once with pyarrow string
+    kernels; takes a pyarrow array or a list of strings, returns a
+    pyarrow array. Nulls stay null.
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    k = strings if isinstance(strings, (pa.Array, pa.ChunkedArray)) \
+        else pa.array(strings, type=pa.string())
+    replacements = _REPLACEMENTS + ((("'", '’'),) if typostrofe else ())
+    for old, new in replacements:
+        k = pc.replace_substring(k, old, new)
+    k = pc.replace_substring_regex(k, "&nbsp;?", "")
+    k = pc.replace_substring_regex(k, _SPACES_RE2, " ")
+    if translit:
+        # The two alphabets do not overlap, so letter-by-letter
+        # replacement gives the same result as str.translate
+        order = (_UK_LETTERS, _EN_LETTERS) if uk2en \
+            else (_EN_LETTERS, _UK_LETTERS)
+        for old, new in zip(*order):
+            k = pc.replace_substring(k, old, new)
+    # Whitespace runs are single spaces by now
+    return pc.utf8_trim(k, " ")